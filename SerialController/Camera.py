@@ -3,18 +3,24 @@ from __future__ import annotations
 import datetime
 import os
 import threading
+import time
 from logging import DEBUG, NullHandler, getLogger
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
 import cv2
+import numpy as np
 from file_handler import FileHandler
+from FlightRecorder import FlightRecorder
+from ImageProcessing import crop_image
+from ImageWriter import get_encode_params, get_image_writer
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
     from logging import Logger
-    from typing import Literal
+    from typing import Final, Literal
 
     from cv2.typing import MatLike
+    from FrameSource import FrameSource
 
 
 def imwrite(filename: str, img: MatLike, params: Sequence[int] | None = None) -> bool:
@@ -60,9 +66,170 @@ def _get_save_filespec(filename: str) -> str:
     return os.path.join(CAPTURE_DIR, filename)
 
 
+class FrameInfo(NamedTuple):
+    """
+    リングバッファに格納されたフレームのメタデータ。
+
+    seq: フレームの通し番号(カメラ未取得時の初期画像は0)
+    timestamp: 取得時刻(time.perf_counter()の値)
+    """
+
+    seq: int
+    timestamp: float
+
+
+class CaptureProfile(NamedTuple):
+    """
+    キャプチャデバイスに設定するフォーマット。
+
+    fourcc: ピクセルフォーマット("MJPG", "YUYV"など)
+    buffer_size: CAP_PROP_BUFFERSIZE(ドライバ側に溜めるフレーム数)
+    fps: 計測した実測FPS
+    read_latency_ms: 計測したcamera.read()の所要時間の中央値[ms]
+    """
+
+    fourcc: str
+    buffer_size: int
+    fps: float = 0.0
+    read_latency_ms: float = 0.0
+
+    def to_setting(self) -> str:
+        return f"{self.fourcc},{self.buffer_size},{self.fps:.1f},{self.read_latency_ms:.2f}"
+
+    @classmethod
+    def from_setting(cls, value: str | None) -> CaptureProfile | None:
+        """
+        設定ファイルの値から復元する。不正な値の場合はNoneを返す。
+        """
+        if not value:
+            return None
+        try:
+            fourcc, buffer_size, fps, latency = value.split(",")
+            return cls(fourcc, int(buffer_size), float(fps), float(latency))
+        except ValueError:
+            return None
+
+
+# 自動ネゴシエーションで試すフォーマットの組み合わせ
+CAPTURE_PROFILE_CANDIDATES: Final[tuple[CaptureProfile, ...]] = (
+    CaptureProfile("MJPG", 1),
+    CaptureProfile("MJPG", 4),
+    CaptureProfile("YUYV", 1),
+    CaptureProfile("YUYV", 4),
+)
+# フォーマット設定時に要求するFPS(実際のFPSはドライバが対応する範囲で決まる)
+CAPTURE_REQUEST_FPS: Final = 60
+# ネゴシエーションがすべて失敗した場合に元に戻すプロパティ(設定する順)
+CAPTURE_PROFILE_PROPS: Final = (
+    cv2.CAP_PROP_FOURCC,
+    cv2.CAP_PROP_FRAME_WIDTH,
+    cv2.CAP_PROP_FRAME_HEIGHT,
+    cv2.CAP_PROP_FPS,
+    cv2.CAP_PROP_BUFFERSIZE,
+)
+# ネゴシエーションに失敗したカメラとして設定ファイルに保存する値(次回以降は計測しない)
+CAPTURE_PROFILE_FAILED: Final = "failed"
+
+
+class CaptureStatsSnapshot(NamedTuple):
+    """
+    キャプチャスレッドの計測値。
+
+    frames: 取得に成功したフレーム数
+    failures: 取得に失敗した回数
+    fail_streak: 現在の連続失敗回数
+    max_fail_streak: 連続失敗回数の最大値
+    dropped: 一度も読み出されないまま次のフレームに置き換えられたフレーム数
+    fps: 直近の実測FPS
+    read_latency_ms: 直近のcamera.read()の所要時間(p50, p95, p99)[ms]
+    """
+
+    frames: int
+    failures: int
+    fail_streak: int
+    max_fail_streak: int
+    dropped: int
+    fps: float
+    read_latency_ms: tuple[float, float, float]
+
+    def __str__(self) -> str:
+        p50, p95, p99 = self.read_latency_ms
+        return (
+            f"fps={self.fps:.1f} frames={self.frames} dropped={self.dropped} "
+            f"read(ms) p50={p50:.2f} p95={p95:.2f} p99={p99:.2f} "
+            f"failures={self.failures} streak={self.fail_streak}/{self.max_fail_streak}"
+        )
+
+
+class CaptureStats:
+    """
+    キャプチャスレッドの実測値を集計する。
+
+    記録はキャプチャスレッドからのみ行い、直近window件の値を事前確保した配列に保持する。
+    """
+
+    def __init__(self, window: int = 256) -> None:
+        self.__window: int = window
+        self.__timestamps: np.ndarray = np.zeros(window, dtype=np.float64)
+        self.__latencies: np.ndarray = np.zeros(window, dtype=np.float64)
+        self.reset()
+
+    def reset(self) -> None:
+        self.frames: int = 0
+        self.failures: int = 0
+        self.fail_streak: int = 0
+        self.max_fail_streak: int = 0
+        self.dropped: int = 0
+        self.__reads: int = 0
+
+    def record_read(self, latency: float, timestamp: float, success: bool) -> None:
+        self.__latencies[self.__reads % self.__window] = latency
+        self.__reads += 1
+        if success:
+            self.__timestamps[self.frames % self.__window] = timestamp
+            self.frames += 1
+            self.fail_streak = 0
+        else:
+            self.failures += 1
+            self.fail_streak += 1
+            self.max_fail_streak = max(self.max_fail_streak, self.fail_streak)
+
+    def record_dropped(self) -> None:
+        self.dropped += 1
+
+    def snapshot(self) -> CaptureStatsSnapshot:
+        count = min(self.frames, self.__window)
+        fps = 0.0
+        if count >= 2:
+            newest = self.__timestamps[(self.frames - 1) % self.__window]
+            oldest = self.__timestamps[(self.frames - count) % self.__window]
+            if newest > oldest:
+                fps = (count - 1) / (newest - oldest)
+        reads = min(self.__reads, self.__window)
+        if reads > 0:
+            p50, p95, p99 = np.percentile(self.__latencies[:reads], (50, 95, 99)) * 1000
+            latency = (float(p50), float(p95), float(p99))
+        else:
+            latency = (0.0, 0.0, 0.0)
+        return CaptureStatsSnapshot(
+            self.frames,
+            self.failures,
+            self.fail_streak,
+            self.max_fail_streak,
+            self.dropped,
+            fps,
+            latency,
+        )
+
+
 class Camera:
-    def __init__(self, fps: int = 45) -> None:
-        self.camera: cv2.VideoCapture | None = None
+    def __init__(
+        self,
+        fps: int = 45,
+        ring_size: int = 8,
+        stats_log_interval: float = 60.0,
+    ) -> None:
+        self.camera: cv2.VideoCapture | FrameSource | None = None
         self.fps: int = int(fps)
         self.capture_size: tuple[int, int] = (1280, 720)
         self.__flip: bool = False
@@ -73,11 +240,32 @@ class Camera:
             FileHandler.get_asset_path("disabled.png"),
             cv2.IMREAD_COLOR,
         )
-        if image is not None:
-            self.__image_bgr: MatLike = image
-        else:
+        if image is None:
             msg = "asset: disabled.pngが読み込めませんでした。"
             raise ValueError(msg)
+        if ring_size < 2:
+            msg = f"ring_size:{ring_size}は2以上を指定してください。"
+            raise ValueError(msg)
+        # フレームのリングバッファ(キャプチャスレッドのみが書き込む)
+        # 最新のスロット以外に書き込むため、読み出したビューはring_size - 1フレームの間有効
+        # 新しいフレームを格納するたびにwait_for_frameの待機者へ通知する
+        self.__frame_cond: threading.Condition = threading.Condition()
+        self.__ring: list[MatLike] = [image] + [
+            np.empty_like(image) for _ in range(ring_size - 1)
+        ]
+        self.__ring_info: list[FrameInfo] = [
+            FrameInfo(0, time.perf_counter()) for _ in range(ring_size)
+        ]
+        self.__ring_index: int = 0
+        self.__seq: int = 0
+        self.__consumed_seq: int = 0
+        # 反転する場合にcamera.readの読み込み先として使い回すバッファ
+        self.__read_buffer: MatLike | None = None
+        # キャプチャの実測値(stats_log_interval秒ごとにログへ出力、0以下で出力しない)
+        self.__stats: CaptureStats = CaptureStats()
+        self.stats_log_interval: float = stats_log_interval
+        # 直近のフレームを保持するフライトレコーダー(start_flight_recorderで有効化)
+        self.flight_recorder: FlightRecorder | None = None
         self.thread: threading.Thread
         self._logger: Logger = getLogger(__name__)
         self._logger.addHandler(NullHandler())
@@ -86,7 +274,19 @@ class Camera:
 
     @property
     def image_bgr(self) -> MatLike:
-        return self.__image_bgr.copy()
+        return self.readFrame()
+
+    @property
+    def ring_size(self) -> int:
+        return len(self.__ring)
+
+    @property
+    def frame_info(self) -> FrameInfo:
+        """
+        最新フレームのメタデータを返す。
+        """
+        with self.__frame_cond:
+            return self.__ring_info[self.__ring_index]
 
     @property
     def flip(self) -> bool:
@@ -113,7 +313,19 @@ class Camera:
             self.__flip = True
             self.__flip_mode = -1
 
-    def openCamera(self, cameraId: int) -> None:
+    def openCamera(
+        self,
+        cameraId: int,
+        profile: CaptureProfile | None = None,
+        negotiate: bool = False,
+    ) -> CaptureProfile | None:
+        """
+        キャプチャデバイスを開く。
+
+        profileを指定した場合はそのフォーマットを設定する。
+        negotiateがTrueの場合はフォーマットの組み合わせを計測して最も性能の良いものを設定する。
+        設定したプロファイルを返す(解像度のみ設定した場合はNone)。
+        """
         if self.camera is not None and self.camera.isOpened():
             self._logger.debug("Camera is already opened")
             self.destroy()
@@ -128,11 +340,127 @@ class Camera:
         if not self.camera.isOpened():
             print("Camera ID " + str(cameraId) + " can't open.")
             self._logger.error(f"Camera ID {cameraId} cannot open.")
-            return
+            return None
         print("Camera ID " + str(cameraId) + " opened successfully")
         self._logger.debug(f"Camera ID {cameraId} opened successfully.")
+        if negotiate:
+            profile = self.negotiate_capture_profile()
+        elif profile is not None:
+            self.__apply_capture_profile(profile)
+        if profile is None:
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_size[0])
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_size[1])
+        self.camera_thread_start()
+        return profile
+
+    def negotiate_capture_profile(
+        self,
+        candidates: Sequence[CaptureProfile] = CAPTURE_PROFILE_CANDIDATES,
+        frames: int = 30,
+        timeout: float = 2.0,
+    ) -> CaptureProfile | None:
+        """
+        フォーマットの組み合わせごとに実測FPSとcamera.read()の所要時間を計測し、最も良いものを設定する。
+
+        capture_sizeの解像度で取得できない組み合わせは除外する。
+        実測FPSが同程度(5%以内)であればbuffer_sizeが小さい(遅延が少ない)もの、次にread()が速いものを優先する。
+        すべて失敗した場合は計測前の設定に戻してNoneを返す。
+        """
+        if self.camera is None or not self.camera.isOpened():
+            self._logger.error("Camera is not opened")
+            return None
+        restart = self.__started
+        if restart:
+            self.camera_thread_stop()
+
+        original = [(prop, self.camera.get(prop)) for prop in CAPTURE_PROFILE_PROPS]
+        results: list[CaptureProfile] = []
+        for candidate in candidates:
+            self.__apply_capture_profile(candidate)
+            measured = self.__measure_capture(frames, timeout)
+            if measured is None:
+                self._logger.debug(f"Capture profile {candidate.to_setting()} failed.")
+                continue
+            result = candidate._replace(fps=measured[0], read_latency_ms=measured[1])
+            self._logger.debug(f"Capture profile measured: {result.to_setting()}")
+            results.append(result)
+
+        best = None
+        if results:
+            best_fps = max(result.fps for result in results)
+            best = min(
+                (result for result in results if result.fps >= best_fps * 0.95),
+                key=lambda result: (result.buffer_size, result.read_latency_ms),
+            )
+            self.__apply_capture_profile(best)
+            self._logger.info(f"Capture profile selected: {best.to_setting()}")
+        else:
+            # 最後に試した組み合わせのままにしない(取得できない値(0以下)は設定しない)
+            for prop, value in original:
+                if value > 0:
+                    self.camera.set(prop, value)
+            self._logger.warning(
+                "Capture profile negotiation failed. Restored the original settings.",
+            )
+
+        if restart:
+            self.camera_thread_start()
+        return best
+
+    def __apply_capture_profile(self, profile: CaptureProfile) -> None:
+        if self.camera is None:
+            return
+        # V4L2ではピクセルフォーマットを解像度より先に設定する必要がある
+        self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc(*profile.fourcc))
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_size[0])
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_size[1])
+        self.camera.set(cv2.CAP_PROP_FPS, CAPTURE_REQUEST_FPS)
+        self.camera.set(cv2.CAP_PROP_BUFFERSIZE, profile.buffer_size)
+
+    def __measure_capture(
+        self,
+        frames: int,
+        timeout: float,
+    ) -> tuple[float, float] | None:
+        """
+        実測FPSとcamera.read()の所要時間の中央値[ms]を返す。
+        """
+        if self.camera is None:
+            return None
+        # フォーマット切り替え直後のフレームは除外する
+        for _ in range(3):
+            self.camera.read()
+        latencies: list[float] = []
+        start = time.perf_counter()
+        end = start
+        for _ in range(frames):
+            before = time.perf_counter()
+            ret, frame = self.camera.read()
+            end = time.perf_counter()
+            if not ret or frame is None:
+                return None
+            if (frame.shape[1], frame.shape[0]) != self.capture_size:
+                return None
+            latencies.append(end - before)
+            if end - start > timeout:
+                break
+        if end <= start:
+            return None
+        return len(latencies) / (end - start), float(np.median(latencies)) * 1000
+
+    def openSource(self, source: FrameSource) -> None:
+        """
+        キャプチャデバイスの代わりに動画ファイル/画像ディレクトリ/合成フレームなどのソースを開く。
+        """
+        if self.camera is not None and self.camera.isOpened():
+            self._logger.debug("Camera is already opened")
+            self.destroy()
+
+        self.camera = source
+        if not self.camera.isOpened():
+            self._logger.error(f"Frame source {type(source).__name__} cannot open.")
+            return
+        self._logger.debug(f"Frame source {type(source).__name__} opened successfully.")
         self.camera_thread_start()
 
     def isOpened(self) -> bool:
@@ -141,7 +469,178 @@ class Camera:
         return False
 
     def readFrame(self) -> MatLike:
-        return self.__image_bgr.copy()
+        frame, _ = self.read_frame_view()
+        return frame.copy()
+
+    def read_frame_view(self) -> tuple[MatLike, FrameInfo]:
+        """
+        最新フレームを読み取り専用のビューとしてコピーせずに返す。
+
+        ビューはリングバッファの実体を参照しているため、
+        ring_size - 1フレーム以上保持する場合はis_frame_validで確認するかcopyすること。
+        """
+        with self.__frame_cond:
+            frame = self.__ring[self.__ring_index].view()
+            info = self.__ring_info[self.__ring_index]
+            self.__consumed_seq = max(self.__consumed_seq, info.seq)
+        frame.flags.writeable = False
+        return frame, info
+
+    def read_roi(
+        self,
+        crop: list[int] | None = None,
+        copy: bool = True,
+    ) -> tuple[MatLike, FrameInfo]:
+        """
+        最新フレームの指定範囲だけを取得する。cropはcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]。
+
+        copyがTrueの場合は範囲内のみを複製して返し、Falseの場合は読み取り専用のビューを返す。
+        """
+        with self.__frame_cond:
+            frame = self.__ring[self.__ring_index]
+            info = self.__ring_info[self.__ring_index]
+            self.__consumed_seq = max(self.__consumed_seq, info.seq)
+            roi = crop_image(frame, crop=crop)
+            if copy:
+                return roi.copy(), info
+        roi = roi.view()
+        roi.flags.writeable = False
+        return roi, info
+
+    def is_frame_valid(self, info: FrameInfo) -> bool:
+        """
+        read_frame_viewで取得したビューがまだ上書きされていないかを返す。
+        """
+        with self.__frame_cond:
+            return info.seq > self.__seq - len(self.__ring) + 1
+
+    def wait_for_frame(
+        self,
+        after_seq: int | None = None,
+        timeout: float | None = None,
+    ) -> tuple[MatLike, FrameInfo] | None:
+        """
+        after_seqより新しいフレームが取得されるまで待機し、読み取り専用のビューを返す。
+
+        after_seqを省略した場合は現在の最新フレームの次のフレームを待つ。
+        timeoutまでに取得できなかった場合、またはキャプチャスレッドが停止している場合はNoneを返す。
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self.__frame_cond:
+            if after_seq is None:
+                after_seq = self.__seq
+            while self.__seq <= after_seq:
+                if not self.__started:
+                    return None
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.__frame_cond.wait(remaining)
+            frame = self.__ring[self.__ring_index].view()
+            info = self.__ring_info[self.__ring_index]
+            self.__consumed_seq = max(self.__consumed_seq, info.seq)
+        frame.flags.writeable = False
+        return frame, info
+
+    def __slot(self, index: int, frame: MatLike) -> MatLike:
+        """
+        リングバッファのスロットを返す。frameと形状が異なる場合(解像度変更時)のみ確保し直す。
+        """
+        buffer = self.__ring[index]
+        if buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+            self.__ring[index] = buffer
+        return buffer
+
+    def __read_into_slot(self, index: int) -> tuple[bool, MatLike | None]:
+        """
+        次のフレームをリングバッファのスロットへ直接読み込む。
+
+        反転しない場合はスロットへ、反転する場合は使い回しのバッファへ読み込んでからスロットへ反転する。
+        解像度が変わらない限り、フレームごとの配列の確保は発生しない。
+        """
+        if self.camera is None:
+            return False, None
+        if not self.flip:
+            slot = self.__ring[index]
+            ret, frame = self.camera.read(slot)
+            if not ret or frame is None:
+                return False, None
+            if frame is not slot:
+                # 形状が異なり読み込み先に使えなかった場合は複製する
+                slot = self.__slot(index, frame)
+                np.copyto(slot, frame)
+            return True, slot
+
+        ret, frame = self.camera.read(self.__read_buffer)
+        if not ret or frame is None:
+            return False, None
+        self.__read_buffer = frame
+        slot = self.__slot(index, frame)
+        cv2.flip(frame, self.flip_mode, dst=slot)
+        return True, slot
+
+    def __publish_frame(self, index: int, timestamp: float) -> None:
+        """
+        スロットに書き込んだフレームを最新フレームとして公開する。
+        """
+        buffer = self.__ring[index]
+        info = FrameInfo(self.__seq + 1, timestamp)
+        with self.__frame_cond:
+            if self.__consumed_seq < self.__seq:
+                self.__stats.record_dropped()
+            self.__ring_info[index] = info
+            self.__ring_index = index
+            self.__seq = info.seq
+            self.__frame_cond.notify_all()
+        recorder = self.flight_recorder
+        if recorder is not None:
+            recorder.push(buffer, info.timestamp)
+
+    def start_flight_recorder(
+        self,
+        seconds: float = 10.0,
+        fps: float = 15.0,
+        scale: float = 0.5,
+        jpeg_quality: int | None = 80,
+        max_bytes: int = 128 * 1024 * 1024,
+    ) -> FlightRecorder:
+        """
+        直近seconds秒分のフレームをメモリに保持するフライトレコーダーを開始する。
+        """
+        if self.flight_recorder is not None:
+            self.flight_recorder.close()
+        self.flight_recorder = FlightRecorder(
+            seconds=seconds,
+            fps=fps,
+            scale=scale,
+            jpeg_quality=jpeg_quality,
+            max_bytes=max_bytes,
+        )
+        self._logger.debug("Flight recorder started")
+        return self.flight_recorder
+
+    def stop_flight_recorder(self) -> None:
+        if self.flight_recorder is not None:
+            self.flight_recorder.close()
+        self.flight_recorder = None
+        self._logger.debug("Flight recorder stopped")
+
+    def get_capture_stats(self) -> CaptureStatsSnapshot:
+        """
+        実測FPS、camera.read()の所要時間、失敗回数、読まれずに置き換えられたフレーム数を返す。
+        """
+        return self.__stats.snapshot()
+
+    def reset_capture_stats(self) -> None:
+        self.__stats.reset()
+
+    def __notify_stopped(self) -> None:
+        """
+        キャプチャスレッドの停止をwait_for_frameの待機者へ通知する。
+        """
+        with self.__frame_cond:
+            self.__frame_cond.notify_all()
 
     def saveCapture(
         self,
@@ -149,32 +648,50 @@ class Camera:
         crop: int | Literal["1"] | Literal["2"] | None = None,
         crop_ax: list[int] | None = None,
         img: MatLike | None = None,
+        ext: str = ".png",
+        quality: int | None = None,
+        async_save: bool = False,
     ) -> None:
+        """
+        現在のフレームを保存する。
+
+        ext: 保存形式(.png/.jpg/.webpなど)
+        quality: 圧縮パラメータ(pngは圧縮レベル0-9、jpg/webpは画質)
+        async_save: Trueの場合は共有のImageWriterでエンコードと書き込みを行い、すぐに戻る(戻った時点ではファイルはまだない)
+        """
         if crop_ax is None:
             crop_ax = [0, 0, 1280, 720]
 
         dt_now = datetime.datetime.now()
         if filename is None or filename == "":
-            filename = dt_now.strftime("%Y-%m-%d_%H-%M-%S") + ".png"
+            filename = dt_now.strftime("%Y-%m-%d_%H-%M-%S") + ext
         else:
-            filename = filename + ".png"
+            filename = filename + ext
 
+        # 保存時に複製またはエンコードするため、ここではコピーしない
         if crop is None:
-            image = self.readFrame()
+            image, _ = self.read_frame_view()
         elif crop in {1, "1"}:
-            image = self.readFrame()[crop_ax[1] : crop_ax[3], crop_ax[0] : crop_ax[2]]
+            image = self.read_frame_view()[0][
+                crop_ax[1] : crop_ax[3],
+                crop_ax[0] : crop_ax[2],
+            ]
         elif crop in {2, "2"}:
-            image = self.readFrame()[
+            image = self.read_frame_view()[0][
                 crop_ax[1] : crop_ax[1] + crop_ax[3],
                 crop_ax[0] : crop_ax[0] + crop_ax[2],
             ]
         elif img is not None:
             image = img
         else:
-            image = self.readFrame()
+            image, _ = self.read_frame_view()
 
         save_path = _get_save_filespec(filename)
 
+        if async_save:
+            get_image_writer().submit(save_path, image, quality=quality)
+            return
+
         if not os.path.exists(os.path.dirname(save_path)) or not os.path.isdir(
             os.path.dirname(save_path),
         ):
@@ -185,7 +702,7 @@ class Camera:
             self._logger.debug("Created Capture folder")
 
         try:
-            imwrite(save_path, image)
+            imwrite(save_path, image, get_encode_params(ext, quality))
             self._logger.debug(f"Capture succeeded: {save_path}")
             print("capture succeeded: " + save_path)
         except cv2.error as e:
@@ -224,19 +741,30 @@ class Camera:
             self._logger.error("Camera is not opened")
             return
         self._logger.debug("Camera update thread started")
-        fail_count = 0
+        stats = self.__stats
+        last_log = time.perf_counter()
         while self.__started:
+            start = time.perf_counter()
             try:
-                ret, frame = self.camera.read()
+                # 公開中のスロットには書き込まないよう、次のスロットへ読み込む
+                index = (self.__ring_index + 1) % len(self.__ring)
+                ret, _ = self.__read_into_slot(index)
+                timestamp = time.perf_counter()
+                stats.record_read(timestamp - start, timestamp, ret)
                 if ret:
-                    if self.flip:
-                        frame = cv2.flip(frame, self.flip_mode)
-                    self.__image_bgr = frame
-                    fail_count = 0
-                else:
-                    fail_count += 1
-                    if fail_count >= 120:
-                        self.__started = False
-                        break
+                    self.__publish_frame(index, timestamp)
+                elif stats.fail_streak >= 120:
+                    self._logger.warning(
+                        f"Camera read failed {stats.fail_streak} times in a row: {stats.snapshot()}",
+                    )
+                    self.__started = False
+                    break
             except cv2.error as e:
+                timestamp = time.perf_counter()
+                stats.record_read(timestamp - start, timestamp, False)
                 self._logger.info(f"Suppress camera read error: {e}")
+            if 0 < self.stats_log_interval <= timestamp - last_log:
+                self._logger.info(f"Capture stats: {stats.snapshot()}")
+                last_log = timestamp
+        self.__notify_stopped()
+        self._logger.debug("Camera update thread finished")
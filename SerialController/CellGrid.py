@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from numpy import absolute, einsum, float32, ones, sqrt
+from numpy.lib.stride_tricks import as_strided
+
+if TYPE_CHECKING:
+    from cv2.typing import MatLike
+    from numpy import ndarray
+
+
+def _sum_pixels(values: ndarray) -> ndarray:
+    """
+    (行, 列, 画素数[, チャンネル数])の配列を画素方向に合計する。
+    numpyのsum/meanは途中の軸の集計が遅いため、1を並べたベクトルとの積で計算する。
+    """
+    weights = ones(values.shape[2], dtype=float32)
+    if values.ndim == 4:
+        return weights @ values
+    return values @ weights
+
+
+class CellGrid:
+    """
+    ボックスのスロットやパーティの枠など、等間隔に格子状に並んだセルをまとめて判定する。
+
+    originは左上のセルの左上の座標(x, y)、cell_sizeはセルのサイズ(幅, 高さ)。
+    pitchは隣のセルまでの間隔(x, y)で、省略した場合はcell_sizeと同じ(隙間なく並ぶ)。
+    各判定はセルを重ねた配列(行, 列, 高さ, 幅[, チャンネル])に対してまとめて行い、(行, 列)の配列を返す。
+    """
+
+    def __init__(
+        self,
+        origin: tuple[int, int],
+        cell_size: tuple[int, int],
+        rows: int,
+        cols: int,
+        pitch: tuple[int, int] | None = None,
+    ) -> None:
+        if rows <= 0 or cols <= 0 or min(cell_size) <= 0:
+            msg = f"rows:{rows}, cols:{cols}, cell_size:{cell_size}は正の値を指定してください。"
+            raise ValueError(msg)
+        self.origin: tuple[int, int] = origin
+        self.cell_size: tuple[int, int] = cell_size
+        self.rows: int = rows
+        self.cols: int = cols
+        self.pitch: tuple[int, int] = pitch if pitch is not None else cell_size
+        if min(self.pitch) <= 0:
+            msg = f"pitch:{self.pitch}は正の値を指定してください。"
+            raise ValueError(msg)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.rows, self.cols
+
+    @property
+    def bounds(self) -> list[int]:
+        """
+        全セルを含む範囲をcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]で返す。
+        """
+        x, y = self.origin
+        width, height = self.cell_size
+        return [
+            y,
+            y + (self.rows - 1) * self.pitch[1] + height,
+            x,
+            x + (self.cols - 1) * self.pitch[0] + width,
+        ]
+
+    def crop(self, row: int, col: int) -> list[int]:
+        """
+        セルの範囲をcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]で返す。
+        """
+        x = self.origin[0] + col * self.pitch[0]
+        y = self.origin[1] + row * self.pitch[1]
+        return [y, y + self.cell_size[1], x, x + self.cell_size[0]]
+
+    def cells(self, image: MatLike) -> ndarray:
+        """
+        画像を分割したセルを重ねた配列(行, 列, 高さ, 幅[, チャンネル])を返す。
+        コピーせずに元の画像を参照する読み取り専用のビュー。
+        """
+        y0, y1, x0, x1 = self.bounds
+        if y0 < 0 or x0 < 0 or y1 > image.shape[0] or x1 > image.shape[1]:
+            msg = f"グリッドの範囲{self.bounds}が画像のサイズ{image.shape[:2]}を超えています。"
+            raise ValueError(msg)
+        region = image[y0:, x0:]
+        width, height = self.cell_size
+        return as_strided(
+            region,
+            shape=(self.rows, self.cols, height, width, *region.shape[2:]),
+            strides=(
+                self.pitch[1] * region.strides[0],
+                self.pitch[0] * region.strides[1],
+                *region.strides,
+            ),
+            writeable=False,
+        )
+
+    def mean_color(self, image: MatLike) -> ndarray:
+        """
+        セルごとの画素値の平均を返す。カラー画像は(行, 列, チャンネル)、グレースケール画像は(行, 列)。
+        """
+        width, height = self.cell_size
+        pixels = self.cells(image).reshape(self.rows, self.cols, height * width, -1)
+        mean = _sum_pixels(pixels.astype(float32)) / pixels.shape[2]
+        return mean if image.ndim == 3 else mean[..., 0]
+
+    def stddev(self, image: MatLike) -> ndarray:
+        """
+        セルごとの画素値の標準偏差(全チャンネル)を返す(行, 列)。無地のセルほど小さい。
+        """
+        values = self.cells(image).reshape(self.rows, self.cols, -1).astype(float32)
+        values -= (_sum_pixels(values) / values.shape[2])[..., None]
+        return sqrt(einsum("rcn,rcn->rc", values, values) / values.shape[2])
+
+    def difference(self, image: MatLike, reference: MatLike) -> ndarray:
+        """
+        セルごとにreference(セルと同じサイズの画像)との画素値の差の平均を返す(行, 列)。
+        """
+        cells = self.cells(image)
+        if cells.shape[2:] != reference.shape:
+            msg = f"referenceのサイズ{reference.shape}がセルのサイズ{cells.shape[2:]}と一致しません。"
+            raise ValueError(msg)
+        diff = absolute(cells.astype(float32) - reference.astype(float32))
+        diff = diff.reshape(self.rows, self.cols, -1)
+        return _sum_pixels(diff) / diff.shape[2]
+
+    def occupied(
+        self,
+        image: MatLike,
+        empty: MatLike,
+        threshold: float = 10.0,
+    ) -> ndarray:
+        """
+        空のセルの画像emptyとの画素値の差の平均がthresholdを超えるセルをTrueとした配列を返す(行, 列)。
+        """
+        return self.difference(image, empty) > threshold
+
+    def template_scores(
+        self,
+        image: MatLike,
+        template: MatLike,
+        offset: tuple[int, int] = (0, 0),
+    ) -> ndarray:
+        """
+        各セルのoffset(セルの左上からの位置(x, y))にtemplateを重ねたときの類似度を返す(行, 列)。
+        類似度はmatchTemplateのTM_CCOEFF_NORMEDと同じ(位置は探索しない)。imageとtemplateのチャンネル数は揃えておくこと。
+        """
+        cells = self.cells(image)
+        height, width = template.shape[:2]
+        x, y = offset
+        if (
+            x < 0
+            or y < 0
+            or x + width > self.cell_size[0]
+            or y + height > self.cell_size[1]
+        ):
+            msg = f"offset:{offset}のtemplate(サイズ{(width, height)})がセルの範囲を超えています。"
+            raise ValueError(msg)
+        if cells.shape[4:] != template.shape[2:]:
+            msg = f"templateのチャンネル数{template.shape[2:]}が画像{cells.shape[4:]}と一致しません。"
+            raise ValueError(msg)
+        # チャンネルごとに平均を引いてから、セルごとに1次元に並べて内積を取る
+        patches = cells[:, :, y : y + height, x : x + width].reshape(
+            self.rows,
+            self.cols,
+            height * width,
+            -1,
+        )
+        patches = patches - patches.mean(axis=2, keepdims=True, dtype=float32)
+        patches = patches.reshape(self.rows, self.cols, -1)
+        centered = template.reshape(height * width, -1).astype(float32)
+        centered = (centered - centered.mean(axis=0)).reshape(-1)
+        numerator = patches @ centered
+        denominator = sqrt((patches * patches).sum(axis=2) * float(centered @ centered))
+        # 無地の部分(分散が0)は類似度0とする
+        denominator[denominator == 0] = float32("inf")
+        return numerator / denominator
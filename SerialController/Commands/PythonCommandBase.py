@@ -10,10 +10,11 @@ import threading
 import time
 import traceback
 from abc import ABC, abstractmethod
+from concurrent.futures import wait as futures_wait
 from functools import wraps
 from logging import DEBUG, Logger, NullHandler, getLogger
 from time import sleep
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
 try:
     from plyer import notification
@@ -26,20 +27,46 @@ except Exception:
 from Commands import CommandBase
 from Commands.Keys import KeyPress
 from DiscordNotify import Discord_Notify
-from ImageProcessing import ImageProcessing, crop_image, getImage, opneImage
+from HashPrefilter import HashPrefilter, PrefilterStats
+from ImageProcessing import (
+    ChangeGate,
+    FrameCache,
+    HitStats,
+    ImageProcessing,
+    TemplateHit,
+    TemplateTracker,
+    calc_color_histogram,
+    calc_color_ratio,
+    calc_mean_color,
+    calc_median_color,
+    compare_histogram,
+    crop_image,
+    doPreprocessImage,
+    get_image_processing,
+    getImage,
+    opneImage,
+)
 from LineNotify import Line_Notify
 from Settings import GuiSettings
+from TemplateStore import get_template_store
+from TextReader import get_text_reader
 
 if TYPE_CHECKING:
     from collections.abc import Callable, Sequence
+    from concurrent.futures import Future
     from typing import Concatenate, Final, Literal, ParamSpec, TypeVar
 
     from Camera import Camera
+    from CellGrid import CellGrid
     from Commands.Keys import GamepadInput
     from Commands.Sender import Sender
     from cv2.typing import MatLike
+    from GlyphReader import GlyphReader, GlyphResult, SegmentMode
     from gui.assets import CaptureArea
-    from ImageProcessing import CropFmt
+    from ImageProcessing import ColorSpace, CropFmt, HistogramMethod, MatchEngine
+    from numpy import ndarray
+    from ScreenRecognizer import ScreenRecognizer, ScreenResult
+    from TextReader import OcrPreset
 
     PythonCommandLike = TypeVar("PythonCommandLike", bound="PythonCommand")
     P = ParamSpec("P")
@@ -51,6 +78,30 @@ class StopThread(Exception):
     pass
 
 
+# wait_until/wait_anyで条件の評価を待つ間にAliveフラグ・一時停止を確認する間隔(秒)
+WAIT_CHECK_INTERVAL: Final = 0.1
+
+
+class WaitResult(NamedTuple):
+    """
+    wait_until/wait_anyの結果。
+
+    matchedは成立した条件の番号(タイムアウトした場合は-1)、valueはその条件が返した値。
+    seqとtimestampは条件を評価したときの最新フレームの通し番号と取得時刻(time.perf_counter()の値)。
+    elapsedは待機を始めてから条件が成立するまでの時間(秒、一時停止していた時間を除く)。
+    真偽値としては条件が成立した場合にTrueとなる。
+    """
+
+    matched: int
+    value: object
+    seq: int
+    timestamp: float
+    elapsed: float
+
+    def __bool__(self) -> bool:
+        return self.matched >= 0
+
+
 # Python command
 
 
@@ -117,7 +168,8 @@ class PythonCommand(CommandBase.Command, ABC):
         ]
         print("--------内部変数一覧--------")
         for k, v in var_dict.items():
-            if k not in del_dict:
+            # ImageProcPythonCommandが内部で保持しているキャッシュも表示しない
+            if k not in del_dict and not k.startswith("_ImageProcPythonCommand__"):
                 print(k, "=", v)
 
         print("----------------------------")
@@ -465,6 +517,17 @@ class ImageProcPythonCommand(PythonCommand, ABC):
 
         self.camera: Camera = cam
         self.gui: CaptureArea | None = gui
+        self.__frame_cache: FrameCache | None = None
+        self.__tracker: TemplateTracker = TemplateTracker()
+        # skip_unchanged=Trueのときに前回の結果を保持する(isContainTemplate/isContainTemplate_max用)
+        self.__template_gate: ChangeGate[tuple[Sequence[int], int, int, float]] = (
+            ChangeGate()
+        )
+        self.__template_max_gate: ChangeGate[
+            tuple[int, list[float], list[Sequence[int]], list[int], list[int]]
+        ] = ChangeGate()
+        # prefilter=Trueのときに使う知覚ハッシュによる事前判定
+        self.__prefilter: HashPrefilter = HashPrefilter()
 
     def get_filespec(self, filename: str, mode: str = "t") -> str:
         """
@@ -501,11 +564,94 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         # crop_fmtに応じてcropの中身を並び替える
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
-        # カメラの画像を取得
-        src = self.camera.readFrame()
+        # カメラの画像からトリミング範囲だけを取得
+        src, _ = self.camera.read_roi(crop_cv2)
+        return src
 
-        # トリミング
-        return crop_image(src, crop=crop_cv2)
+    def get_frame_cache(self) -> FrameCache:
+        """
+        最新フレームのFrameCacheを返す。
+        フレームが更新されていなければ前回と同じものを返すため、グレースケール化などの変換を共有できる。
+        """
+        frame, info = self.camera.read_frame_view()
+        cache = self.__frame_cache
+        if cache is None or cache.seq != info.seq:
+            # 照合や遅延変換の途中でリングバッファのスロットが上書きされないよう、フレームごとに1回だけ複製する
+            frame = frame.copy()
+            frame.flags.writeable = False
+            cache = FrameCache(frame, info.seq)
+            self.__frame_cache = cache
+        return cache
+
+    def set_change_gate(self, tolerance: float = 8.0, size: int = 32) -> None:
+        """
+        skip_unchanged=Trueで「変化していない」とみなす条件を設定する。
+
+        cropの範囲を縦横size画素に縮小して比較し、すべての画素で値の差がtolerance以下であれば変化なしとする。
+        設定すると保持している結果は破棄される。
+        """
+        for gate in (self.__template_gate, self.__template_max_gate):
+            gate.tolerance = tolerance
+            gate.size = size
+            gate.reset()
+
+    def get_change_gate_stats(self) -> HitStats:
+        """
+        skip_unchanged=Trueで前回の結果を使った回数(hits)とテンプレートマッチングを行った回数(misses)を返す。
+        """
+        template = self.__template_gate.stats()
+        template_max = self.__template_max_gate.stats()
+        return HitStats(
+            template.hits + template_max.hits,
+            template.misses + template_max.misses,
+        )
+
+    def set_hash_prefilter(
+        self,
+        method: Literal["dhash", "phash"] = "dhash",
+        hash_size: int = 8,
+        reject_distance: int = 24,
+        max_slack: float = 0.1,
+        audit_interval: int = 50,
+    ) -> None:
+        """
+        isContainTemplate(prefilter=True)の事前判定の条件を設定する。
+
+        探索範囲とテンプレートの知覚ハッシュのハミング距離がreject_distanceを超えた場合にテンプレートマッチングを省略する。
+        探索範囲の縦横がテンプレートよりmax_slack(割合)を超えて大きい場合は事前判定を行わない。
+        audit_interval回の省略ごとに1回はテンプレートマッチングも行い、誤って省略していないかを確認する。
+        設定すると統計はリセットされる。
+        """
+        self.__prefilter = HashPrefilter(
+            method=method,
+            hash_size=hash_size,
+            reject_distance=reject_distance,
+            max_slack=max_slack,
+            audit_interval=audit_interval,
+        )
+
+    def get_prefilter_stats(self) -> PrefilterStats:
+        """
+        isContainTemplate(prefilter=True)で事前判定した回数・テンプレートマッチングを省略した回数・確認の結果を返す。
+        """
+        return self.__prefilter.stats()
+
+    def get_tracking_stats(self) -> HitStats:
+        """
+        isContainTemplate(track=True)で前回の位置の周辺で見つかった回数(hits)と全体を探索した回数(misses)を返す。
+        """
+        return self.__tracker.stats()
+
+    def set_match_engine(self, engine: MatchEngine = "opencv") -> None:
+        """
+        テンプレートマッチングの方式を設定する(プロセス全体で共有する設定)。
+
+        "numba"では、小さなテンプレート(縦横20px以下のアイコンなど)を狭い範囲(track=Trueの周辺探索や位置が決まっている判定)で探す場合に、
+        numbaでコンパイルした照合を使う(2値化した画像ではビット演算で照合する)。類似度と位置はmatchTemplateと同じ。
+        それ以外の場合はmatchTemplateを使う。初回はコンパイルに数秒かかるが、結果は保存されるため次回以降の起動ではかからない。
+        get_image_processing().check_match_engine(画像, テンプレート)でどちらが速いかを確認できる。
+        """
+        get_image_processing().set_match_engine(engine)
 
     def openImage(self, filename: str, mode: str = "t") -> MatLike | None:
         """
@@ -513,6 +659,51 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         """
         return getImage(self.get_filespec(filename, mode=mode), mode="color")
 
+    def __load_template(
+        self,
+        template_path: str | MatLike,
+        mask_path: str | MatLike | None,
+        use_gray: bool,
+        crop_template: list[int],
+        BGR_range: dict[Literal["lower", "upper"], int | tuple[int, int, int]] | None,
+        threshold_binary: int | None,
+    ) -> tuple[MatLike, tuple[MatLike, int, int] | None, MatLike | None]:
+        """
+        テンプレート画像、前処理済みのテンプレート画像、マスク画像を取得する。
+        ファイルの場合は前処理済みの画像ごとTemplateStoreから取得する(ndarrayを渡した場合は前処理済みの画像はNone)。
+        """
+        store = get_template_store()
+        preprocessed_template = None
+        if isinstance(template_path, ImageProcessing.image_type):
+            template_image = template_path
+        else:
+            template_file = self.get_filespec(template_path, mode="t")
+            template_image = store.read(template_file, mode="color")
+            preprocessed_template = store.preprocessed(
+                template_file,
+                use_gray=use_gray,
+                crop=crop_template,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
+
+        # マスク画像を取得
+        if isinstance(mask_path, ImageProcessing.image_type):
+            mask_image = mask_path
+        else:
+            mask_image = (
+                store.read(self.get_filespec(mask_path, mode="t"), mode="binary")
+                if mask_path is not None
+                else None
+            )
+
+        if template_image is None:
+            msg = f"template_path:{template_path}から画像を取得できませんでした。"
+            raise ValueError(
+                msg,
+            )
+        return template_image, preprocessed_template, mask_image
+
     @pausedecorator
     def isContainTemplate(
         self,
@@ -533,60 +724,135 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         crop_template: list[int] | None = None,
         show_image: bool = False,
         color: list[str] | None = None,
+        pyramid_level: int = 0,
+        track: bool = False,
+        skip_unchanged: bool = False,
+        prefilter: bool = False,
     ) -> bool:
         """
         現在のスクリーンショットと指定した画像のテンプレートマッチングを行います。
         色の違いを考慮しないのであればパフォーマンスの点からuse_grayをTrueにしてグレースケール画像を使うことを推奨します。
+        pyramid_levelを1(1/2)または2(1/4)にすると、縮小画像で候補を絞ってから照合するため広い範囲の探索が速くなります。
+        trackをTrueにすると、前回見つかった位置の周辺を先に探索し、見つからなかった場合のみcropの範囲全体を探索します。
+        skip_unchangedをTrueにすると、cropの範囲が前回の判定時から変化していない場合は前回の結果を使います(set_change_gateを参照)。
+        prefilterをTrueにすると、cropがテンプレートとほぼ同じ大きさの場合に知覚ハッシュで明らかに一致しないものを
+        テンプレートマッチングせずにFalseとします(set_hash_prefilterを参照)。マスク画像を指定した場合は使われません。
         """
 
         # crop_fmtに応じてcropの中身を並び替える
         crop_cv2, crop_pillow = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
         crop_template_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop_template)
 
-        # カメラの画像を取得
-        src = self.camera.readFrame()
-
-        # テンプレート画像を取得
-        if isinstance(template_path, ImageProcessing.image_type):
-            template_image = template_path
-        else:
-            template_image = getImage(
-                self.get_filespec(template_path, mode="t"),
-                mode="color",
-            )
-
-        # マスク画像を取得
-        if isinstance(mask_path, ImageProcessing.image_type):
-            mask_image = mask_path
-        else:
-            mask_image = (
-                getImage(self.get_filespec(mask_path, mode="t"), mode="binary")
-                if mask_path is not None
-                else None
-            )
-
-        if template_image is None:
-            msg = f"template_path:{template_path}から画像を取得できませんでした。"
-            raise ValueError(
-                msg,
-            )
+        # カメラの画像を取得(同じフレームに対する変換はキャッシュを共有する)
+        frame_cache = self.get_frame_cache()
+        src = frame_cache.frame
 
-        # テンプレートマッチング
-        res, max_loc, width, height, max_val = ImageProcessing(
-            use_gpu=use_gpu,
-        ).isContainTemplate(
-            src,
-            template_image,
-            mask_image=mask_image,
-            threshold=threshold,
+        # テンプレート画像・マスク画像を取得
+        template_image, preprocessed_template, mask_image = self.__load_template(
+            template_path,
+            mask_path,
             use_gray=use_gray,
-            crop=crop_cv2,
+            crop_template=crop_template_cv2,
             BGR_range=BGR_range,
             threshold_binary=threshold_binary,
-            crop_template=crop_template_cv2,
-            show_image=show_image,
         )
 
+        def match(
+            search_crop: list[int],
+            level: int,
+        ) -> tuple[bool, Sequence[int], int, int, float]:
+            return get_image_processing(use_gpu=use_gpu).isContainTemplate(
+                src,
+                template_image,
+                mask_image=mask_image,
+                threshold=threshold,
+                use_gray=use_gray,
+                crop=search_crop,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+                crop_template=crop_template_cv2,
+                show_image=show_image,
+                frame_cache=frame_cache,
+                preprocessed_template=preprocessed_template,
+                pyramid_level=level,
+                prefilter=self.__prefilter if prefilter else None,
+            )
+
+        # テンプレートマッチングの条件(テンプレートをndarrayで渡した場合はidで区別する)
+        query_key = (
+            template_path if isinstance(template_path, str) else id(template_path),
+            mask_path if isinstance(mask_path, str) else id(mask_path),
+            tuple(crop_cv2),
+            tuple(crop_template_cv2),
+            use_gray,
+            threshold_binary,
+            repr(BGR_range),
+        )
+
+        def search() -> tuple[bool, Sequence[int], int, int, float]:
+            # 追跡する場合は前回見つかった位置の周辺を先に探索する(位置はフレーム全体の座標で保持する)
+            if not track or not isinstance(template_path, str):
+                return match(crop_cv2, pyramid_level)
+            offset_x, offset_y = (
+                (crop_pillow[0], crop_pillow[1]) if crop_pillow else (0, 0)
+            )
+            frame_height, frame_width = src.shape[:2]
+            region = (
+                [
+                    max(0, crop_cv2[0]),
+                    min(frame_height, crop_cv2[1]),
+                    max(0, crop_cv2[2]),
+                    min(frame_width, crop_cv2[3]),
+                ]
+                if crop_cv2
+                else [0, frame_height, 0, frame_width]
+            )
+            window = self.__tracker.window(query_key, region)
+            if window is not None:
+                res, max_loc, width, height, max_val = match(window, 0)
+                if res:
+                    found_x = window[2] + max_loc[0]
+                    found_y = window[0] + max_loc[1]
+                    self.__tracker.hit(query_key, (found_x, found_y, width, height))
+                    # 以降の処理のためにcrop基準の位置に直す
+                    return (
+                        res,
+                        (found_x - offset_x, found_y - offset_y),
+                        width,
+                        height,
+                        max_val,
+                    )
+            res, max_loc, width, height, max_val = match(crop_cv2, pyramid_level)
+            self.__tracker.miss(
+                query_key,
+                (offset_x + max_loc[0], offset_y + max_loc[1], width, height)
+                if res
+                else None,
+            )
+            return res, max_loc, width, height, max_val
+
+        # テンプレートマッチング(探索範囲が前回から変化していなければ前回の結果を使う)
+        if skip_unchanged:
+            gate_key = (*query_key, pyramid_level)
+            deps = (template_image, mask_image)
+            fingerprint = self.__template_gate.fingerprint(
+                crop_image(src, crop=crop_cv2),
+            )
+            cached = self.__template_gate.get(gate_key, fingerprint, deps)
+            if cached is not None:
+                max_loc, width, height, max_val = cached
+                res = max_val > threshold
+            else:
+                res, max_loc, width, height, max_val = search()
+                self.__template_gate.put(
+                    gate_key,
+                    fingerprint,
+                    deps,
+                    (max_loc, width, height, max_val),
+                )
+        else:
+            res, max_loc, width, height, max_val = search()
+
         # テンプレートマッチングの結果(類似度)を表示する
         if show_value or self.isSimilarity:
             tm_mode = "NCC" if mask_path is not None else "ZNCC"
@@ -645,29 +911,51 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         crop_template: list[int] | None = None,
         show_image: bool = False,
         color: list[str] | None = None,
+        pyramid_level: int = 0,
+        parallel: bool = False,
+        stop_on_match: bool = False,
+        skip_unchanged: bool = False,
     ) -> tuple[int, list[float], list[bool]]:
         """
         # 現在のスクリーンショットと指定した複数の画像のテンプレートマッチングを行います。
         # 相関値が最も大きい値となった画像のインデックス、各画像のテンプレートマッチングの閾値、閾値判定結果を返します。
         # 色の違いを考慮しないのであればパフォーマンスの点からuse_grayをTrueにしてグレースケール画像を使うことを推奨します。
+        # pyramid_levelはisContainTemplateと同じです。
+        # parallelをTrueにすると複数のテンプレートを並列に照合します。
+        # stop_on_matchをTrueにすると閾値を超えた画像が見つかった時点で残りの照合を打ち切ります(照合しなかった画像の類似度は-inf)。
+        # skip_unchangedはisContainTemplateと同じです。
         """
 
         # crop_fmtに応じてcropの中身を並び替える
         crop_cv2, crop_pillow = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
         crop_template_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop_template)
 
-        # カメラの画像を取得
-        src = self.camera.readFrame()
+        # カメラの画像を取得(同じフレームに対する変換はキャッシュを共有する)
+        frame_cache = self.get_frame_cache()
+        src = frame_cache.frame
 
-        # テンプレート画像を取得
+        # テンプレート画像を取得(ファイルの場合は前処理済みの画像ごとTemplateStoreから取得する)
+        store = get_template_store()
         template_image_list: list[MatLike] = []
+        preprocessed_template_list: list[tuple[MatLike, int, int] | None] = []
         for i in template_path_list:
             if isinstance(i, ImageProcessing.image_type):
                 template_image_list.append(i)
+                preprocessed_template_list.append(None)
             else:
-                image = getImage(self.get_filespec(i, mode="t"), mode="color")
+                template_file = self.get_filespec(i, mode="t")
+                image = store.read(template_file, mode="color")
                 if image is not None:
                     template_image_list.append(image)
+                    preprocessed_template_list.append(
+                        store.preprocessed(
+                            template_file,
+                            use_gray=use_gray,
+                            crop=crop_template_cv2,
+                            BGR_range=BGR_range,
+                            threshold_binary=threshold_binary,
+                        ),
+                    )
                 else:
                     msg = f"template_path:{i}から画像を取得できませんでした。"
                     raise ValueError(
@@ -684,24 +972,65 @@ class ImageProcPythonCommand(PythonCommand, ABC):
                     mask_image_list.append(None)
                 else:
                     mask_image_list.append(
-                        getImage(self.get_filespec(i, mode="t"), mode="binary"),
+                        store.read(self.get_filespec(i, mode="t"), mode="binary"),
                     )
 
-        # テンプレートマッチング
-        max_idx, max_val_list, max_loc_list, width_list, height_list, judge_list = (
-            ImageProcessing(use_gpu=False).isContainTemplate_max(
-                src,
-                template_image_list,
-                mask_image_list=mask_image_list,
-                threshold=threshold,
-                use_gray=use_gray,
-                crop=crop_cv2,
-                BGR_range=BGR_range,
-                threshold_binary=threshold_binary,
-                crop_template=crop_template_cv2,
-                show_image=show_image,
+        def match() -> tuple[
+            int,
+            list[float],
+            list[Sequence[int]],
+            list[int],
+            list[int],
+        ]:
+            max_idx, max_val_list, max_loc_list, width_list, height_list, _ = (
+                get_image_processing().isContainTemplate_max(
+                    src,
+                    template_image_list,
+                    mask_image_list=mask_image_list,
+                    threshold=threshold,
+                    use_gray=use_gray,
+                    crop=crop_cv2,
+                    BGR_range=BGR_range,
+                    threshold_binary=threshold_binary,
+                    crop_template=crop_template_cv2,
+                    show_image=show_image,
+                    frame_cache=frame_cache,
+                    preprocessed_template_list=preprocessed_template_list,
+                    pyramid_level=pyramid_level,
+                    parallel=parallel,
+                    stop_on_match=stop_on_match,
+                )
             )
-        )
+            return max_idx, max_val_list, max_loc_list, width_list, height_list
+
+        # テンプレートマッチング(探索範囲が前回から変化していなければ前回の結果を使う)
+        if skip_unchanged:
+            gate_key = (
+                tuple(i if isinstance(i, str) else id(i) for i in template_path_list),
+                tuple(
+                    i if isinstance(i, str) else id(i) for i in (mask_path_list or [])
+                ),
+                tuple(crop_cv2),
+                tuple(crop_template_cv2),
+                use_gray,
+                threshold_binary,
+                repr(BGR_range),
+                pyramid_level,
+                # 打ち切る場合は閾値によって結果が変わる
+                threshold if stop_on_match else None,
+            )
+            deps = (*template_image_list, *mask_image_list)
+            fingerprint = self.__template_max_gate.fingerprint(
+                crop_image(src, crop=crop_cv2),
+            )
+            result = self.__template_max_gate.get(gate_key, fingerprint, deps)
+            if result is None:
+                result = match()
+                self.__template_max_gate.put(gate_key, fingerprint, deps, result)
+        else:
+            result = match()
+        max_idx, max_val_list, max_loc_list, width_list, height_list = result
+        judge_list = [max_val > threshold for max_val in max_val_list]
 
         # テンプレートマッチングの結果(類似度)を表示する
         if show_value or self.isSimilarity:
@@ -753,6 +1082,442 @@ class ImageProcPythonCommand(PythonCommand, ABC):
 
         return max_idx, max_val_list, judge_list
 
+    @pausedecorator
+    def find_all(
+        self,
+        template_path: str,
+        threshold: float = 0.7,
+        min_distance: int | None = None,
+        max_results: int | None = None,
+        use_gray: bool = True,
+        show_value: bool = False,
+        show_position: bool = True,
+        ms: float = 2000,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        mask_path: str | None = None,
+        use_gpu: bool = False,
+        BGR_range: dict[Literal["lower", "upper"], int | tuple[int, int, int]]
+        | None = None,
+        threshold_binary: int | None = None,
+        crop_template: list[int] | None = None,
+        color: list[str] | None = None,
+    ) -> list[TemplateHit]:
+        """
+        現在のスクリーンショットから指定した画像と一致する位置をすべて探します。
+        1回のテンプレートマッチングで、類似度が閾値を超えた位置を類似度の高い順に返します(位置はフレーム全体の座標)。
+        min_distance画素以内(縦横とも)の位置は同じ物体とみなします(省略時はテンプレートの短辺の半分)。
+        ボックスの全スロットのマークを数えるなど、同じ画像が複数表示される画面の判定に使います。
+        """
+
+        # crop_fmtに応じてcropの中身を並び替える
+        crop_cv2, crop_pillow = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        crop_template_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop_template)
+
+        # カメラの画像を取得(同じフレームに対する変換はキャッシュを共有する)
+        frame_cache = self.get_frame_cache()
+
+        # テンプレート画像・マスク画像を取得
+        template_image, preprocessed_template, mask_image = self.__load_template(
+            template_path,
+            mask_path,
+            use_gray=use_gray,
+            crop_template=crop_template_cv2,
+            BGR_range=BGR_range,
+            threshold_binary=threshold_binary,
+        )
+
+        hits = get_image_processing(use_gpu=use_gpu).find_all(
+            frame_cache.frame,
+            template_image,
+            mask_image=mask_image,
+            threshold=threshold,
+            min_distance=min_distance,
+            max_results=max_results,
+            use_gray=use_gray,
+            crop=crop_cv2,
+            BGR_range=BGR_range,
+            threshold_binary=threshold_binary,
+            crop_template=crop_template_cv2,
+            frame_cache=frame_cache,
+            preprocessed_template=preprocessed_template,
+        )
+
+        # フレーム全体の座標に直す
+        if crop_pillow != []:
+            hits = [
+                hit._replace(x=hit.x + crop_pillow[0], y=hit.y + crop_pillow[1])
+                for hit in hits
+            ]
+
+        # テンプレートマッチングの結果(件数と類似度)を表示する
+        if show_value or self.isSimilarity:
+            print(f"{template_path} found: {len(hits)}")
+            for hit in hits:
+                print(f"  ({hit.x}, {hit.y}) value: {hit.score}")
+
+        # canvasに検出位置を表示
+        if show_position:
+            if color is None:
+                color = ["blue", "orange"]
+            for index, hit in enumerate(hits):
+                tag = str(time.perf_counter()) + str(random.random())
+                self.displayRectangle(
+                    (hit.x, hit.y),
+                    hit.width,
+                    hit.height,
+                    tag,
+                    ms,
+                    color=color,
+                    # crop範囲は1回だけ表示する
+                    crop=crop_pillow if index == 0 else None,
+                )
+
+        return hits
+
+    @pausedecorator
+    def grid_template_scores(
+        self,
+        grid: CellGrid,
+        template_path: str,
+        offset: tuple[int, int] = (0, 0),
+        use_gray: bool = True,
+        show_value: bool = False,
+    ) -> ndarray:
+        """
+        現在のスクリーンショットのCellGridの各セルについて、offset(セルの左上からの位置(x, y))に置いたテンプレートとの類似度をまとめて計算します。
+        戻り値は(行, 列)の配列で、閾値と比較すると各セルの判定結果になります(例: grid_template_scores(grid, "mark.png") > 0.9)。
+        """
+        frame_cache = self.get_frame_cache()
+        if isinstance(template_path, ImageProcessing.image_type):
+            template, _, _ = doPreprocessImage(template_path, use_gray=use_gray)
+        else:
+            preprocessed = get_template_store().preprocessed(
+                self.get_filespec(template_path, mode="t"),
+                use_gray=use_gray,
+            )
+            if preprocessed is None:
+                msg = f"template_path:{template_path}から画像を取得できませんでした。"
+                raise ValueError(msg)
+            template = preprocessed[0]
+
+        scores = grid.template_scores(
+            frame_cache.gray() if use_gray else frame_cache.frame,
+            template,
+            offset=offset,
+        )
+
+        # テンプレートマッチングの結果(類似度)を表示する
+        if show_value or self.isSimilarity:
+            print(f"{template_path} value:")
+            print(scores.round(3))
+
+        return scores
+
+    @pausedecorator
+    def mean_color(
+        self,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        color_space: ColorSpace = "BGR",
+    ) -> tuple[float, ...]:
+        """
+        現在のスクリーンショットのcropの範囲の平均色を返します。
+        color_space="BGR"では(B, G, R)、"HSV"では(H, S, V)(Hは0-179)、"GRAY"では(明るさ,)です。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        return calc_mean_color(self.get_frame_cache().region(crop_cv2, color_space))
+
+    @pausedecorator
+    def median_color(
+        self,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        color_space: ColorSpace = "BGR",
+    ) -> tuple[float, ...]:
+        """
+        現在のスクリーンショットのcropの範囲の色の中央値(チャンネルごと)を返します。
+        一部に別の色(文字やカーソルなど)が含まれる範囲では平均色よりも安定します。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        return calc_median_color(
+            self.get_frame_cache().region(crop_cv2, color_space),
+        )
+
+    @pausedecorator
+    def luminance(
+        self,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+    ) -> float:
+        """
+        現在のスクリーンショットのcropの範囲の明るさ(グレースケールの平均、0-255)を返します。
+        暗転の判定などに使います(例: self.luminance() < 10)。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        return calc_mean_color(self.get_frame_cache().region(crop_cv2, "GRAY"))[0]
+
+    @pausedecorator
+    def color_ratio(
+        self,
+        lower: int | Sequence[int],
+        upper: int | Sequence[int],
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        color_space: ColorSpace = "BGR",
+    ) -> float:
+        """
+        現在のスクリーンショットのcropの範囲で、色がlower以上upper以下の画素の割合(0-1)を返します。
+        lower/upperはcolor_spaceの順(BGRなら(B, G, R))で指定します(例: self.color_ratio((0, 0, 150), (80, 80, 255)) > 0.5)。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        return calc_color_ratio(
+            self.get_frame_cache().region(crop_cv2, color_space),
+            lower,
+            upper,
+        )
+
+    @pausedecorator
+    def histogram_distance(
+        self,
+        reference_path: str,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        color_space: ColorSpace = "HSV",
+        bins: int = 16,
+        method: HistogramMethod = "bhattacharyya",
+    ) -> float:
+        """
+        現在のスクリーンショットのcropの範囲と基準画像の色のヒストグラムを比較します。
+        method="bhattacharyya"では同じ色の分布なら0、まったく異なれば1に近づきます。
+        位置が少しずれても結果が変わりにくいため、背景や画面全体の雰囲気の判定に使います。
+        基準画像のヒストグラムは画像ファイルごとに保持します。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+
+        def build(image: MatLike) -> MatLike:
+            return calc_color_histogram(
+                FrameCache(image).region(None, color_space),
+                color_space,
+                bins,
+            )
+
+        if isinstance(reference_path, ImageProcessing.image_type):
+            reference = build(reference_path)
+        else:
+            reference = get_template_store().derived(
+                self.get_filespec(reference_path, mode="t"),
+                ("histogram", color_space, bins),
+                build,
+            )
+            if reference is None:
+                msg = f"reference_path:{reference_path}から画像を取得できませんでした。"
+                raise ValueError(msg)
+
+        hist = calc_color_histogram(
+            self.get_frame_cache().region(crop_cv2, color_space),
+            color_space,
+            bins,
+        )
+        return compare_histogram(hist, reference, method)
+
+    def read_text_async(
+        self,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        charset: str | None = None,
+        preprocess: str | OcrPreset = "default",
+    ) -> Future[str]:
+        """
+        現在のスクリーンショットのcropの範囲の文字をOCRで読み取るよう予約し、結果のFutureを返します。
+        OCRはワーカースレッドで行われるため、結果を待たずにボタン入力などを続けられます(future.result()で結果を取得)。
+        引数はread_textと同じです。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        return get_text_reader().submit(
+            self.get_frame_cache().region(crop_cv2),
+            charset=charset,
+            preset=preprocess,
+        )
+
+    @pausedecorator
+    def read_text(
+        self,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        charset: str | None = None,
+        preprocess: str | OcrPreset = "default",
+        timeout: float | None = None,
+    ) -> str:
+        """
+        現在のスクリーンショットのcropの範囲の文字をOCR(pyocr/Tesseract)で読み取ります。
+        charsetには認識する文字の候補を指定します(例: 数字のみなら"0123456789")。
+        preprocessは前処理の名前(TextReader.OCR_PRESETSのキー: "default", "dark_text", "light_text", "digits", "light_digits", "none")
+        またはOcrPresetで、暗い背景に明るい文字の場合は"light_text"などの反転する前処理を指定します。
+        前処理後の画像が前回と同じであれば、OCRを行わずに前回の結果を返します。
+        """
+        future = self.read_text_async(crop_fmt, crop, charset, preprocess)
+        start = time.perf_counter()
+        # OCRの完了を待つ間も停止の要求を確認する
+        while not future.done():
+            if timeout is not None and time.perf_counter() - start >= timeout:
+                msg = f"OCRが{timeout}秒以内に完了しませんでした。"
+                raise TimeoutError(msg)
+            futures_wait([future], timeout=WAIT_CHECK_INTERVAL)
+            self.checkIfAlive()
+        return future.result()
+
+    @pausedecorator
+    def read_glyphs(
+        self,
+        reader: GlyphReader,
+        crop_fmt: CropFmt = "",
+        crop: list[int] | None = None,
+        mode: SegmentMode = "components",
+        cell_width: int | None = None,
+        pitch: int | None = None,
+        show_value: bool = False,
+    ) -> GlyphResult:
+        """
+        現在のスクリーンショットのcropの範囲の文字を、GlyphReaderのグリフ画像と比較して読み取ります。
+        ゲーム内の数字など決まったフォントの文字であれば、OCRより高速に読み取れます。
+        readerはGlyphReader.from_directory(self.get_filespec("digits"))のように作成して使い回します。
+        結果のtextが読み取った文字列、scoresが文字ごとの類似度です。
+        """
+        crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
+        result = reader.read(
+            self.get_frame_cache().region(crop_cv2, "GRAY"),
+            mode=mode,
+            cell_width=cell_width,
+            pitch=pitch,
+        )
+
+        # 文字ごとの類似度を表示する
+        if show_value or self.isSimilarity:
+            print(f"{result.text!r} value: {[round(s, 3) for s in result.scores]}")
+
+        return result
+
+    @pausedecorator
+    def recognize_screen(
+        self,
+        recognizer: ScreenRecognizer,
+        short_circuit: bool = True,
+        show_value: bool = False,
+    ) -> ScreenResult:
+        """
+        現在のスクリーンショットに対して、ScreenRecognizerに登録した画面の状態をまとめて評価します。
+        カメラの画像の取得・変換は1回だけ行われ、判定した状態の名前と各状態の類似度を返します。
+        """
+        result = recognizer.recognize(
+            self.get_frame_cache(),
+            short_circuit=short_circuit,
+            resolve=lambda path: self.get_filespec(path, mode="t"),
+        )
+
+        # テンプレートマッチングの結果(類似度)を表示する
+        if show_value or self.isSimilarity:
+            for name, score in result.scores.items():
+                print(f"{name} value: {score}")
+
+        return result
+
+    def wait_until(
+        self,
+        condition: Callable[[], object],
+        timeout: float | None = None,
+        poll: Literal["frame"] | float = "frame",
+    ) -> WaitResult:
+        """
+        conditionが成立する(真となる値を返す)まで待機します。
+        引数と戻り値はwait_anyと同じです。
+        """
+        return self.wait_any([condition], timeout=timeout, poll=poll)
+
+    def wait_any(
+        self,
+        conditions: Sequence[Callable[[], object]],
+        timeout: float | None = None,
+        poll: Literal["frame"] | float = "frame",
+    ) -> WaitResult:
+        """
+        conditionsのいずれかが成立する(真となる値を返す)まで待機し、成立した条件の番号と時刻を返します。
+
+        poll="frame"の場合は、最初に現在のフレームで、以降はカメラから新しいフレームが取得されるたびに1回ずつ、
+        先頭から順に条件を評価します(キャプチャが止まっている間はWAIT_CHECK_INTERVAL秒ごとに評価します)。
+        数値を指定した場合はその間隔(秒)で評価します。
+        timeout(秒)までにどの条件も成立しなければmatched=-1の結果を返します(Noneの場合は成立するまで待ちます)。
+        待機中も停止・一時停止はすぐに反映され、一時停止していた時間はtimeoutに含めません。
+
+        例:
+            result = self.wait_any(
+                [
+                    lambda: self.isContainTemplate("egg.png", show_position=False),
+                    lambda: self.isContainTemplate("box.png", show_position=False),
+                ],
+                timeout=10,
+            )
+            if result.matched == 0:
+                ...
+        """
+        if poll != "frame" and float(poll) <= 0:
+            msg = f"poll:{poll}には正の数を指定してください。"
+            raise ValueError(msg)
+
+        start = time.perf_counter()
+        paused = 0.0
+        next_at = start
+        evaluate = True
+        info = self.camera.frame_info
+        while True:
+            self.checkIfAlive()
+            if self.isPause:
+                # 一時停止中は評価せず、再開後に最新のフレームで評価し直す
+                paused_at = time.perf_counter()
+                self.show_var()
+                while self.isPause:
+                    sleep(WAIT_CHECK_INTERVAL)
+                    self.checkIfAlive()
+                paused += time.perf_counter() - paused_at
+                evaluate = True
+
+            if evaluate:
+                info = self.camera.frame_info
+                next_at = time.perf_counter() + (0.0 if poll == "frame" else poll)
+                for index, condition in enumerate(conditions):
+                    value = condition()
+                    if value:
+                        elapsed = time.perf_counter() - start - paused
+                        return WaitResult(
+                            index,
+                            value,
+                            info.seq,
+                            info.timestamp,
+                            elapsed,
+                        )
+
+            elapsed = time.perf_counter() - start - paused
+            if timeout is not None and elapsed >= timeout:
+                return WaitResult(-1, None, info.seq, info.timestamp, elapsed)
+
+            # 停止・一時停止を確認するため、WAIT_CHECK_INTERVAL以上は続けて待たない
+            interval = WAIT_CHECK_INTERVAL
+            if timeout is not None:
+                interval = min(interval, timeout - elapsed)
+            waited_at = time.perf_counter()
+            if poll == "frame":
+                if (
+                    self.camera.wait_for_frame(after_seq=info.seq, timeout=interval)
+                    is None
+                ):
+                    # キャプチャスレッドの停止中やフレームが届かない間もWAIT_CHECK_INTERVALごとに評価し直す
+                    # (停止中はすぐに戻るため、空回りしないよう残りの時間を待つ)
+                    sleep(max(0.0, interval - (time.perf_counter() - waited_at)))
+                evaluate = True
+            else:
+                sleep(max(0.0, min(interval, next_at - waited_at)))
+                evaluate = time.perf_counter() >= next_at
+
     @pausedecorator
     def isContainTemplateGPU(
         self,
@@ -831,21 +1596,23 @@ class ImageProcPythonCommand(PythonCommand, ABC):
             crop=crop_template,
         )
 
-        # カメラの画像を取得
-        template_image = self.camera.readFrame()
+        # カメラの画像を取得(同じフレームに対する変換はキャッシュを共有する)
+        frame_cache = self.get_frame_cache()
+        template_image = frame_cache.frame
 
         # テンプレートマッチング対象画像を取得
+        store = get_template_store()
         if isinstance(image_path, ImageProcessing.image_type):
             image = image_path
         else:
-            image = getImage(self.get_filespec(image_path, mode="t"), mode="color")
+            image = store.read(self.get_filespec(image_path, mode="t"), mode="color")
 
         # マスク画像を取得
         if isinstance(mask_path, ImageProcessing.image_type):
             mask_image = mask_path
         else:
             mask_image = (
-                getImage(self.get_filespec(mask_path, mode="t"), mode="binary")
+                store.read(self.get_filespec(mask_path, mode="t"), mode="binary")
                 if mask_path is not None
                 else None
             )
@@ -854,7 +1621,7 @@ class ImageProcPythonCommand(PythonCommand, ABC):
             raise ValueError(msg)
 
         # テンプレートマッチング
-        res, _, width, height, max_val = ImageProcessing(
+        res, _, width, height, max_val = get_image_processing(
             use_gpu=use_gpu,
         ).isContainTemplate(
             image,
@@ -867,6 +1634,7 @@ class ImageProcPythonCommand(PythonCommand, ABC):
             threshold_binary=threshold_binary,
             crop_template=crop_template_cv2,
             show_image=show_image,
+            template_cache=frame_cache,
         )
 
         # テンプレートマッチングの結果(類似度)を表示する
@@ -1006,31 +1774,70 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         crop_fmt: CropFmt = "",
         crop: list[int] | None = None,
         mode: bool = True,
+        ext: str = ".png",
+        quality: int | None = None,
+        async_save: bool = False,
     ) -> None:
         """
         画面をキャプチャします。
         (camera.saveCaptureと同じ機能。)
+        async_save=Trueにすると保存はバックグラウンドで行われ、コマンドの入力タイミングに影響しません。
+        (その場合は戻った時点ではまだファイルが保存されていません。)
         """
 
         # crop_fmtに応じてcropの中身を並び替える
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
-        # カメラの画像を取得
-        src = self.camera.readFrame()
+        # カメラの画像を取得(読み取り専用のため複製しない)
+        src, _ = self.camera.read_frame_view()
 
         # ファイル名を設定する
         if filename is None or filename == "":
             dt_now = datetime.datetime.now()
-            filename = dt_now.strftime("%Y-%m-%d_%H-%M-%S") + ".png"
+            filename = dt_now.strftime("%Y-%m-%d_%H-%M-%S") + ext
         else:
-            filename = filename + ".png"
+            filename = filename + ext
         if mode:
             save_path = self.get_filespec(filename, mode="c")
         else:
             save_path = self.get_filespec(filename, mode="n")
 
         # 画像を保存する
-        ImageProcessing().saveImage(src, filename=save_path, crop=crop_cv2)
+        get_image_processing().saveImage(
+            src,
+            filename=save_path,
+            crop=crop_cv2,
+            quality=quality,
+            async_save=async_save,
+        )
+
+    def dump_flight_recorder(
+        self,
+        filename: str | None = None,
+        mode: bool = True,
+    ) -> threading.Thread | None:
+        """
+        フライトレコーダーが保持している直近のフレームを動画ファイル(.avi)に保存します。
+        保存は別スレッドで行われ、そのスレッドを返します。
+        (事前にself.camera.start_flight_recorder()で開始しておく必要があります。)
+        """
+        recorder = self.camera.flight_recorder
+        if recorder is None:
+            print("フライトレコーダーが開始されていません。")
+            return None
+
+        # ファイル名を設定する
+        if filename is None or filename == "":
+            dt_now = datetime.datetime.now()
+            filename = dt_now.strftime("%Y-%m-%d_%H-%M-%S") + ".avi"
+        elif not os.path.splitext(filename)[1]:
+            filename = filename + ".avi"
+        if mode:
+            save_path = self.get_filespec(filename, mode="c")
+        else:
+            save_path = self.get_filespec(filename, mode="n")
+
+        return recorder.dump(save_path)
 
     def popupImage(
         self,
@@ -1044,10 +1851,10 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         # crop_fmtに応じてcropの中身を並び替える
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
-        # カメラの画像を取得
-        src = self.camera.readFrame()
+        # カメラの画像からトリミング範囲だけを取得
+        src, _ = self.camera.read_roi(crop_cv2)
 
-        opneImage(src, crop=crop_cv2, title=title)
+        opneImage(src, title=title)
 
     def LINE_image(
         self,
@@ -1088,11 +1895,8 @@ class ImageProcPythonCommand(PythonCommand, ABC):
         # crop_fmtに応じてcropの中身を並び替える
         crop_cv2, _ = convertCv2Format(crop_fmt=crop_fmt, crop=crop)
 
-        # カメラの画像を取得
-        src = self.camera.readFrame()
-
-        # トリミング
-        cropped_image = crop_image(src, crop=crop_cv2)
+        # カメラの画像からトリミング範囲だけを取得
+        cropped_image, _ = self.camera.read_roi(crop_cv2)
 
         # webhook_urlのindex指定とkey設定
         if index != 0 and keys == "DISCORD_WEBHOOK":
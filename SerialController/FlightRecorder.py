@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from logging import DEBUG, NullHandler, getLogger
+from typing import TYPE_CHECKING
+
+import cv2
+
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from cv2.typing import MatLike
+
+# 保存する拡張子ごとのコーデック
+_FOURCC_BY_EXT = {".avi": "MJPG", ".mp4": "mp4v"}
+# 縮小・圧縮待ちにできるフレーム数
+_ENCODE_QUEUE_SIZE = 4
+# dumpで圧縮待ちのフレームを待つ最大時間(秒)
+_DUMP_FLUSH_TIMEOUT = 1.0
+
+
+class FlightRecorder:
+    """
+    直近seconds秒分のフレームをメモリ上に保持し、要求に応じて動画ファイルに書き出す。
+
+    フレームはfpsの間隔で間引き、scaleで縮小、jpeg_qualityを指定した場合はJPEGで圧縮して保持する。
+    保持サイズがmax_bytesを超える場合は古いフレームから破棄する。
+    キャプチャスレッドを遅らせないよう、縮小と圧縮はワーカースレッドで行う。
+    圧縮待ちが_ENCODE_QUEUE_SIZEを超えた場合はそのフレームを記録しない(droppedに数える)。
+    """
+
+    def __init__(
+        self,
+        seconds: float = 10.0,
+        fps: float = 15.0,
+        scale: float = 0.5,
+        jpeg_quality: int | None = 80,
+        max_bytes: int = 128 * 1024 * 1024,
+    ) -> None:
+        self._logger: Logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+        self.seconds: float = seconds
+        self.fps: float = fps
+        self.scale: float = scale
+        self.jpeg_quality: int | None = jpeg_quality
+        self.max_bytes: int = max_bytes
+        self.dropped: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+        self.__frames: deque[tuple[float, MatLike]] = deque()
+        self.__bytes: int = 0
+        self.__last_timestamp: float | None = None
+        # 縮小・圧縮待ちのフレーム(Noneはワーカーの終了)
+        self.__queue: queue.Queue[tuple[float, MatLike] | None] = queue.Queue(
+            maxsize=_ENCODE_QUEUE_SIZE,
+        )
+        self.__worker: threading.Thread = threading.Thread(
+            target=self.__run,
+            name="FlightRecorderEncoderThread",
+            daemon=True,
+        )
+        self.__worker.start()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.__bytes
+
+    def __len__(self) -> int:
+        return len(self.__frames)
+
+    def push(self, frame: MatLike, timestamp: float) -> None:
+        """
+        フレームを記録する。キャプチャスレッドから呼ばれるため、複製してワーカースレッドに渡すだけにする。
+        timestampは取得時刻(time.perf_counter()の値)。
+        """
+        if (
+            self.__last_timestamp is not None
+            and timestamp - self.__last_timestamp < 1.0 / self.fps
+        ):
+            return
+        self.__last_timestamp = timestamp
+        try:
+            self.__queue.put_nowait((timestamp, frame.copy()))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """
+        圧縮待ちのフレームを処理してからワーカースレッドを終了する。保持しているフレームはdumpできる。
+        """
+        self.__queue.put(None)
+
+    def __run(self) -> None:
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is None:
+                    return
+                self.__store(*item)
+            finally:
+                self.__queue.task_done()
+
+    def __store(self, timestamp: float, frame: MatLike) -> None:
+        if self.scale != 1.0:
+            data = cv2.resize(
+                frame,
+                None,
+                fx=self.scale,
+                fy=self.scale,
+                interpolation=cv2.INTER_AREA,
+            )
+        else:
+            data = frame.copy()
+        if self.jpeg_quality is not None:
+            ret, encoded = cv2.imencode(
+                ".jpg",
+                data,
+                [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality],
+            )
+            if not ret:
+                return
+            data = encoded
+
+        with self.__lock:
+            self.__frames.append((timestamp, data))
+            self.__bytes += data.nbytes
+            # 古いフレームを時間とメモリ上限の両方で破棄する
+            while self.__frames and (
+                self.__bytes > self.max_bytes
+                or timestamp - self.__frames[0][0] > self.seconds
+            ):
+                _, old = self.__frames.popleft()
+                self.__bytes -= old.nbytes
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__frames.clear()
+            self.__bytes = 0
+
+    def dump(self, filename: str) -> threading.Thread | None:
+        """
+        保持しているフレームを別スレッドで動画ファイルに書き出す。
+        呼び出した時点で圧縮待ちのフレームも、圧縮が終わるのを待って含める。
+
+        拡張子は.avi(MJPG)または.mp4(mp4v)。書き出しを行うスレッドを返す(フレームがない場合はNone)。
+        """
+        requested = time.perf_counter()
+        with self.__lock:
+            frames = list(self.__frames)
+        pending = self.__queue.unfinished_tasks > 0
+        if not frames and not pending:
+            self._logger.info("Flight recorder has no frames to dump.")
+            return None
+        thread = threading.Thread(
+            target=self.__write,
+            args=(filename, frames, requested if pending else None),
+            name="FlightRecorderThread",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def __write(
+        self,
+        filename: str,
+        frames: list[tuple[float, MatLike]],
+        requested: float | None,
+    ) -> None:
+        if requested is not None:
+            # 圧縮待ちだったフレームのうち、dumpを呼び出した時点までのものを追加する
+            deadline = time.perf_counter() + _DUMP_FLUSH_TIMEOUT
+            while self.__queue.unfinished_tasks > 0 and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            last = frames[-1][0] if frames else -math.inf
+            with self.__lock:
+                frames.extend(
+                    frame for frame in self.__frames if last < frame[0] <= requested
+                )
+            if not frames:
+                self._logger.info("Flight recorder has no frames to dump.")
+                return
+        ext = os.path.splitext(filename)[1].lower()
+        fourcc = _FOURCC_BY_EXT.get(ext, "MJPG")
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        writer: cv2.VideoWriter | None = None
+        try:
+            for _, data in frames:
+                # JPEGで保持している場合は1次元のバイト列になっている
+                image = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.ndim == 1 else data
+                if image is None:
+                    continue
+                if writer is None:
+                    writer = cv2.VideoWriter(
+                        filename,
+                        cv2.VideoWriter.fourcc(*fourcc),
+                        self.fps,
+                        (image.shape[1], image.shape[0]),
+                    )
+                writer.write(image)
+            self._logger.debug(
+                f"Flight recorder dumped {len(frames)} frames: {filename}",
+            )
+            print(f"flight recorder saved: {filename}")
+        except cv2.error as e:
+            print("Flight recorder dump failed")
+            self._logger.error(f"Flight recorder dump failed: {e}")
+        finally:
+            if writer is not None:
+                writer.release()
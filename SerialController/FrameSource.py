@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import glob
+import os
+import time
+from abc import ABC, abstractmethod
+from logging import DEBUG, NullHandler, getLogger
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from logging import Logger
+
+    from cv2.typing import MatLike
+
+# fpsにこの値(0以下)を指定すると待機せずに可能な限り高速にフレームを返す
+AS_FAST_AS_POSSIBLE = 0.0
+
+
+class FrameSource(ABC):
+    """
+    キャプチャデバイスの代わりにCameraへフレームを供給するソースの基底クラス。
+
+    Cameraが使用するcv2.VideoCaptureのメソッド(isOpened/read/set/get/release)と同じ形で呼び出せる。
+    fpsが正の値の場合はその間隔でフレームを返し、0以下の場合は待機せずに返す。
+    """
+
+    def __init__(self, fps: float = AS_FAST_AS_POSSIBLE) -> None:
+        self._logger: Logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+        self.fps: float = float(fps)
+        self._opened: bool = True
+        self.__next_time: float | None = None
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def release(self) -> None:
+        self._opened = False
+
+    def set(self, propId: int, value: float) -> bool:  # noqa: ARG002
+        """
+        プロパティの変更には対応しない。
+        """
+        return False
+
+    def get(self, propId: int) -> float:
+        if propId == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def read(self, image: MatLike | None = None) -> tuple[bool, MatLike | None]:
+        """
+        次のフレームを返す。imageを渡した場合は形状が一致すればそこへ書き込む。
+        """
+        if not self._opened:
+            return False, None
+        self.__wait_next()
+        return self._read(image)
+
+    def __wait_next(self) -> None:
+        """
+        fpsに合わせて次のフレームの時刻まで待機する。
+        """
+        if self.fps <= 0:
+            return
+        now = time.perf_counter()
+        if self.__next_time is None:
+            self.__next_time = now
+        delay = self.__next_time - now
+        if delay > 0:
+            time.sleep(delay)
+        # 処理が遅れた場合は遅れを取り戻そうとせず現在時刻から数え直す
+        self.__next_time = max(self.__next_time, now) + 1.0 / self.fps
+
+    @abstractmethod
+    def _read(self, image: MatLike | None) -> tuple[bool, MatLike | None]:
+        """
+        次のフレームを返す。終端に達した場合は(False, None)を返す。
+        """
+
+
+def _output(
+    frame: MatLike | None,
+    image: MatLike | None,
+) -> tuple[bool, MatLike | None]:
+    """
+    生成したフレームを、形状が一致すれば呼び出し元のバッファへ書き込んで返す。
+    """
+    if frame is None:
+        return False, None
+    if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+        np.copyto(image, frame)
+        return True, image
+    return True, frame
+
+
+class VideoFileSource(FrameSource):
+    """
+    動画ファイル(mp4/aviなど)からフレームを供給する。
+    fpsを省略した場合は動画ファイルのフレームレートで再生する。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fps: float | None = None,
+        loop: bool = True,
+    ) -> None:
+        self.path: str = path
+        self.loop: bool = loop
+        self.__capture: cv2.VideoCapture = cv2.VideoCapture(path)
+        if fps is None:
+            fps = self.__capture.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(fps)
+        self._opened: bool = self.__capture.isOpened()
+        if not self._opened:
+            self._logger.error(f"Video file {path} cannot open.")
+
+    def release(self) -> None:
+        super().release()
+        self.__capture.release()
+
+    def get(self, propId: int) -> float:
+        if propId == cv2.CAP_PROP_FPS:
+            return self.fps
+        return self.__capture.get(propId)
+
+    def _read(self, image: MatLike | None) -> tuple[bool, MatLike | None]:
+        ret, frame = self.__capture.read(image)
+        if not ret and self.loop:
+            self.__capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.__capture.read(image)
+        return ret, frame
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    ディレクトリ内の画像ファイルを名前順にフレームとして供給する。
+    読み込みによる揺らぎを避けるため、画像は生成時にすべてデコードしておく。
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        pattern: str = "*.png",
+        fps: float = AS_FAST_AS_POSSIBLE,
+        loop: bool = True,
+    ) -> None:
+        super().__init__(fps)
+        self.directory: str = directory
+        self.loop: bool = loop
+        self.frames: list[MatLike] = []
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                self._logger.warning(f"Skip unreadable image: {path}")
+                continue
+            self.frames.append(image)
+        self.__index: int = 0
+        self._opened: bool = len(self.frames) > 0
+        if not self._opened:
+            self._logger.error(f"No image found in {directory} ({pattern}).")
+
+    def _read(self, image: MatLike | None) -> tuple[bool, MatLike | None]:
+        if self.__index >= len(self.frames):
+            if not self.loop:
+                return False, None
+            self.__index = 0
+        frame = self.frames[self.__index]
+        self.__index += 1
+        ret, output = _output(frame, image)
+        if output is frame:
+            # 保持している画像を書き換えられないよう複製して返す
+            output = frame.copy()
+        return ret, output
+
+
+def _default_pattern(
+    index: int,
+    size: tuple[int, int],
+    rng: np.random.Generator,
+) -> MatLike:
+    """
+    横に流れるグラデーションにノイズを重ねたフレームを生成する。
+    """
+    width, height = size
+    x = (np.arange(width) + index * 4) % 256
+    y = np.arange(height) % 256
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:, :, 0] = x[None, :]
+    frame[:, :, 1] = y[:, None]
+    frame[:, :, 2] = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+    return frame
+
+
+class SyntheticSource(FrameSource):
+    """
+    プログラムで生成したフレームを供給する。
+
+    generatorには(フレーム番号, (幅, 高さ), 乱数生成器)を受け取りBGR画像を返す関数を指定する。
+    seedが同じであれば毎回同じフレーム列になる。
+    """
+
+    def __init__(
+        self,
+        size: tuple[int, int] = (1280, 720),
+        fps: float = AS_FAST_AS_POSSIBLE,
+        generator: Callable[[int, tuple[int, int], np.random.Generator], MatLike]
+        | None = None,
+        frame_count: int | None = None,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(fps)
+        self.size: tuple[int, int] = size
+        self.generator: Callable[
+            [int, tuple[int, int], np.random.Generator],
+            MatLike,
+        ] = generator if generator is not None else _default_pattern
+        self.frame_count: int | None = frame_count
+        self.__rng: np.random.Generator = np.random.default_rng(seed)
+        self.__index: int = 0
+
+    def get(self, propId: int) -> float:
+        if propId == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.size[0])
+        if propId == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.size[1])
+        return super().get(propId)
+
+    def _read(self, image: MatLike | None) -> tuple[bool, MatLike | None]:
+        if self.frame_count is not None and self.__index >= self.frame_count:
+            return False, None
+        frame = self.generator(self.__index, self.size, self.__rng)
+        self.__index += 1
+        return _output(frame, image)
+
+
+def create_frame_source(
+    spec: str,
+    fps: float | None = None,
+    loop: bool = True,
+) -> FrameSource:
+    """
+    文字列からフレームソースを生成する。
+    "synthetic"なら合成フレーム、ディレクトリなら画像ディレクトリ、それ以外は動画ファイルとして扱う。
+    """
+    if spec == "synthetic":
+        return SyntheticSource(fps=AS_FAST_AS_POSSIBLE if fps is None else fps)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(
+            spec,
+            fps=AS_FAST_AS_POSSIBLE if fps is None else fps,
+            loop=loop,
+        )
+    return VideoFileSource(spec, fps=fps, loop=loop)
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import os
+from itertools import pairwise
+from typing import TYPE_CHECKING, NamedTuple
+
+import cv2
+from ImageProcessing import getImage
+from numpy import arange, float32, maximum, sqrt, zeros
+
+if TYPE_CHECKING:
+    from typing import Literal
+
+    from cv2.typing import MatLike
+    from numpy import ndarray
+
+    type SegmentMode = Literal["components", "cells"]
+
+# ファイル名に使えない文字のグリフ画像の名前
+GLYPH_NAMES: dict[str, str] = {
+    "colon": ":",
+    "slash": "/",
+    "dot": ".",
+    "comma": ",",
+    "minus": "-",
+    "plus": "+",
+    "percent": "%",
+}
+
+GLYPH_EXTENSIONS = (".png", ".bmp", ".jpg", ".jpeg")
+
+
+class GlyphResult(NamedTuple):
+    """
+    GlyphReader.readの結果。
+
+    textは読み取った文字列、scoresは文字ごとの類似度(-1から1、1に近いほど確か)。
+    boxesは文字ごとの範囲(x, y, 幅, 高さ)で、読み取った画像の左上からの座標。
+    """
+
+    text: str
+    scores: tuple[float, ...]
+    boxes: tuple[tuple[int, int, int, int], ...]
+
+    @property
+    def confidence(self) -> float:
+        """
+        最も類似度の低い文字の類似度を返す(文字がない場合は0)。
+        """
+        return min(self.scores, default=0.0)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _glyph_char(filename: str) -> str:
+    """
+    グリフ画像のファイル名から文字を返す。"_"以降は同じ文字の別の画像を区別するためのもので無視する。
+    """
+    name = os.path.splitext(filename)[0].split("_")[0]
+    if name in GLYPH_NAMES:
+        return GLYPH_NAMES[name]
+    if len(name) != 1:
+        msg = f"グリフ画像のファイル名:{filename}は1文字または{list(GLYPH_NAMES)}のいずれかにしてください。"
+        raise ValueError(msg)
+    return name
+
+
+class GlyphReader:
+    """
+    ゲーム内の数字など、決まったフォント・大きさの文字をグリフ画像との比較で読み取る。
+    OCRよりも高速で、数桁の数字であれば1ms未満で読み取れる。
+
+    glyphsは文字とグリフ画像(読み取る画面と同じ大きさで1文字だけを含む画像)の組。文字の周りの余白は自動で除く。
+    light_textは明るい文字(暗い背景)かどうか、thresholdは2値化の閾値(Noneは大津の2値化)。
+    各文字は拡大・縮小せずに枠の中央に置いて比較するため、文字の上下の位置だけが異なる文字("-"と"_"など)は区別できない。
+    """
+
+    def __init__(
+        self,
+        glyphs: list[tuple[str, MatLike]],
+        light_text: bool = True,
+        threshold: int | None = None,
+        min_area: int = 2,
+    ) -> None:
+        if not glyphs:
+            msg = "グリフ画像がありません。"
+            raise ValueError(msg)
+        self.light_text: bool = light_text
+        self.threshold: int | None = threshold
+        self.min_area: int = min_area
+
+        # グリフ画像を2値化して文字の範囲を切り出す
+        chars: list[str] = []
+        binaries: list[MatLike] = []
+        boxes: list[tuple[int, int, int, int]] = []
+        for char, image in glyphs:
+            binary = self.binarize(image)
+            x, y, width, height = cv2.boundingRect(binary)
+            if width == 0 or height == 0:
+                msg = f"文字:{char!r}のグリフ画像に文字が見つかりません。light_text, thresholdを確認してください。"
+                raise ValueError(msg)
+            chars.append(char)
+            binaries.append(binary)
+            boxes.append((x, y, width, height))
+        self.glyph_width: int = max(box[2] for box in boxes)
+        self.glyph_height: int = max(box[3] for box in boxes)
+        self.chars: list[str] = chars
+        # 比較用のグリフの行列(グリフ数, 画素数)
+        self.matrix: ndarray = self.__normalize(binaries, boxes)
+
+    @classmethod
+    def from_directory(
+        cls,
+        path: str,
+        light_text: bool = True,
+        threshold: int | None = None,
+        min_area: int = 2,
+    ) -> GlyphReader:
+        """
+        ディレクトリ内のグリフ画像からGlyphReaderを作成する。
+        ファイル名は文字(例: 0.png)で、同じ文字の画像が複数ある場合は"7_2.png"のように"_"以降で区別する。
+        ファイル名に使えない文字はGLYPH_NAMESの名前(例: colon.png)にする。
+        """
+        glyphs: list[tuple[str, MatLike]] = []
+        for filename in sorted(os.listdir(path)):
+            if not filename.lower().endswith(GLYPH_EXTENSIONS):
+                continue
+            image = getImage(os.path.join(path, filename), mode="gray")
+            if image is None:
+                msg = f"{os.path.join(path, filename)}を読み込めませんでした。"
+                raise ValueError(msg)
+            glyphs.append((_glyph_char(filename), image))
+        return cls(glyphs, light_text, threshold, min_area)
+
+    def binarize(self, image: MatLike) -> MatLike:
+        """
+        文字を255、背景を0とした2値画像を返す。
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        mode = cv2.THRESH_BINARY if self.light_text else cv2.THRESH_BINARY_INV
+        if self.threshold is None:
+            _, binary = cv2.threshold(gray, 0, 255, mode + cv2.THRESH_OTSU)
+        else:
+            _, binary = cv2.threshold(gray, self.threshold, 255, mode)
+        return binary
+
+    def segment(
+        self,
+        binary: MatLike,
+        mode: SegmentMode = "components",
+        cell_width: int | None = None,
+        pitch: int | None = None,
+    ) -> list[tuple[int, int, int, int]]:
+        """
+        2値画像を文字ごとの範囲(x, y, 幅, 高さ)に分割し、左から順に返す。
+
+        mode="components"では連結成分を求め、横方向に重なる成分(":"の2つの点など)を1文字にまとめる。
+        min_area画素未満の成分は除き、最も幅の広いグリフより広い成分はくっついた複数の文字として分割する。
+        mode="cells"では左端からpitch(省略時はcell_width)ごとの幅cell_widthのセルに分割し、文字のないセルは除く。
+        文字同士がくっついている場合に使う。
+        """
+        boxes: list[tuple[int, int, int, int]] = []
+        if mode == "cells":
+            if cell_width is None or cell_width <= 0:
+                msg = 'mode="cells"ではcell_widthに正の値を指定してください。'
+                raise ValueError(msg)
+            step = pitch if pitch is not None else cell_width
+            for x in range(0, binary.shape[1] - cell_width + 1, step):
+                x0, y0, width, height = cv2.boundingRect(binary[:, x : x + cell_width])
+                if width > 0 and width * height >= self.min_area:
+                    boxes.append((x + x0, y0, width, height))
+            return boxes
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        components = sorted(
+            (int(x), int(y), int(x + w), int(y + h))
+            for x, y, w, h, area in stats[1:count]
+            if area >= self.min_area
+        )
+        merged: list[list[int]] = []
+        for x0, y0, x1, y1 in components:
+            if merged and x0 < merged[-1][2]:
+                last = merged[-1]
+                last[1] = min(last[1], y0)
+                last[2] = max(last[2], x1)
+                last[3] = max(last[3], y1)
+            else:
+                merged.append([x0, y0, x1, y1])
+        for x0, y0, x1, y1 in merged:
+            boxes.extend(self.__split(binary, x0, x1, y0, y1))
+        return boxes
+
+    def read(
+        self,
+        image: MatLike,
+        mode: SegmentMode = "components",
+        cell_width: int | None = None,
+        pitch: int | None = None,
+    ) -> GlyphResult:
+        """
+        画像(読み取る文字だけを含む範囲)の文字を読み取る。
+        すべての文字をグリフの行列との積でまとめて比較し、最も類似度の高いグリフの文字とする。
+        """
+        binary = self.binarize(image)
+        boxes = self.segment(binary, mode, cell_width, pitch)
+        if not boxes:
+            return GlyphResult("", (), ())
+        scores = self.__normalize([binary] * len(boxes), boxes) @ self.matrix.T
+        best = scores.argmax(axis=1)
+        best_scores = scores[arange(len(boxes)), best]
+        return GlyphResult(
+            "".join(self.chars[int(i)] for i in best),
+            tuple(float(score) for score in best_scores),
+            tuple(boxes),
+        )
+
+    def __split(
+        self,
+        binary: MatLike,
+        x0: int,
+        x1: int,
+        y0: int,
+        y1: int,
+    ) -> list[tuple[int, int, int, int]]:
+        """
+        グリフより幅の広い範囲を文字数で分割する。分割位置は等分した位置の近くで文字の画素が最も少ない列にする。
+        """
+        count = -(-(x1 - x0) // (self.glyph_width + 1))
+        if count <= 1:
+            return [(x0, y0, x1 - x0, y1 - y0)]
+        projection = (binary[y0:y1, x0:x1] > 0).sum(axis=0)
+        margin = max(1, self.glyph_width // 4)
+        cuts = [0]
+        for i in range(1, count):
+            center = (x1 - x0) * i // count
+            lo = max(cuts[-1] + 1, center - margin)
+            hi = min(x1 - x0 - 1, center + margin)
+            cuts.append(
+                lo + int(projection[lo : hi + 1].argmin()) if lo <= hi else center,
+            )
+        cuts.append(x1 - x0)
+        boxes: list[tuple[int, int, int, int]] = []
+        for start, end in pairwise(cuts):
+            x, y, width, height = cv2.boundingRect(binary[y0:y1, x0 + start : x0 + end])
+            if width > 0:
+                boxes.append((x0 + start + x, y0 + y, width, height))
+        return boxes
+
+    def __normalize(
+        self,
+        binaries: list[MatLike],
+        boxes: list[tuple[int, int, int, int]],
+    ) -> ndarray:
+        """
+        各文字の範囲をグリフの大きさの枠の中央に置き、
+        平均を引いて長さを1にしたベクトルの行列(文字数, 画素数)を返す。
+        """
+        # 1画素程度の位置のずれを許容するため、枠には余白を設けて比較前にぼかす
+        height, width = self.glyph_height + 4, self.glyph_width + 4
+        canvas = zeros((len(boxes) * height, width), dtype=float32)
+        for i, (binary, (x, y, w, h)) in enumerate(zip(binaries, boxes, strict=True)):
+            # 枠より大きい場合は中央を切り出す
+            sx = x + max(0, (w - width) // 2)
+            sy = y + max(0, (h - height) // 2)
+            cw, ch = min(w, width), min(h, height)
+            top = i * height + (height - ch) // 2
+            left = (width - cw) // 2
+            canvas[top : top + ch, left : left + cw] = binary[
+                sy : sy + ch,
+                sx : sx + cw,
+            ]
+        vectors = cv2.GaussianBlur(canvas, (3, 3), 0).reshape(len(boxes), -1)
+        vectors -= vectors.mean(axis=1, keepdims=True)
+        vectors /= maximum(sqrt((vectors * vectors).sum(axis=1, keepdims=True)), 1e-6)
+        return vectors
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from logging import DEBUG, NullHandler, getLogger
+from typing import TYPE_CHECKING, NamedTuple
+
+import cv2
+import imagehash
+from PIL import Image
+
+if TYPE_CHECKING:
+    from logging import Logger
+    from typing import Literal
+
+    from cv2.typing import MatLike
+
+    type HashMethod = Literal["dhash", "phash"]
+
+
+class PrefilterStats(NamedTuple):
+    """
+    HashPrefilterの統計。
+
+    checked: ハッシュを比較した回数、rejected: テンプレートマッチングを省略した回数
+    audited: 省略の判定が正しいかを確認するためにテンプレートマッチングを行った回数
+    false_rejects: 確認の結果、実際には閾値を超えていた回数
+    """
+
+    checked: int
+    rejected: int
+    audited: int
+    false_rejects: int
+
+    @property
+    def reject_rate(self) -> float:
+        return self.rejected / self.checked if self.checked else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"checked={self.checked} rejected={self.rejected} "
+            f"({self.reject_rate:.1%}) audited={self.audited} "
+            f"false_rejects={self.false_rejects}"
+        )
+
+
+def image_hash(
+    image: MatLike,
+    method: HashMethod = "dhash",
+    hash_size: int = 8,
+) -> imagehash.ImageHash:
+    """
+    画像の知覚ハッシュ(imagehash)を返す。
+    PILでの縮小は画像が大きいほど遅いため、先にcv2でハッシュの計算に必要なサイズまで縮小する。
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # phashは内部でhash_sizeの4倍に縮小してからDCTを行う
+    size = hash_size * 4
+    if image.shape[0] > size and image.shape[1] > size:
+        # 大きな画像は間引いてから縮小する
+        step = max(1, min(image.shape[0], image.shape[1]) // (size * 4))
+        image = cv2.resize(
+            image[::step, ::step],
+            (size, size),
+            interpolation=cv2.INTER_AREA,
+        )
+    if method == "phash":
+        return imagehash.phash(Image.fromarray(image), hash_size=hash_size)
+    return imagehash.dhash(Image.fromarray(image), hash_size=hash_size)
+
+
+class HashPrefilter:
+    """
+    位置が決まっている(探索範囲がテンプレートとほぼ同じ大きさの)テンプレートマッチングの前に、
+    知覚ハッシュで明らかに一致しない場合を判定してテンプレートマッチングを省略する。
+
+    探索範囲とテンプレートのハッシュのハミング距離がreject_distanceを超えた場合に省略する。
+    探索範囲の縦横がテンプレートよりmax_slack(テンプレートのサイズに対する割合)を超えて大きい場合は判定しない。
+    省略したaudit_interval回に1回はテンプレートマッチングも行い、実際には閾値を超えていた場合は警告を出す。
+    """
+
+    def __init__(
+        self,
+        method: HashMethod = "dhash",
+        hash_size: int = 8,
+        reject_distance: int = 24,
+        max_slack: float = 0.1,
+        audit_interval: int = 50,
+        max_entries: int = 256,
+    ) -> None:
+        self._logger: Logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+        self.method: HashMethod = method
+        self.hash_size: int = hash_size
+        self.reject_distance: int = reject_distance
+        self.max_slack: float = max_slack
+        self.audit_interval: int = audit_interval
+        self.max_entries: int = max_entries
+        self.checked: int = 0
+        self.rejected: int = 0
+        self.audited: int = 0
+        self.false_rejects: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+        # テンプレート画像のハッシュ(同じオブジェクトの間だけ使うため画像も保持する)
+        self.__hashes: OrderedDict[int, tuple[MatLike, imagehash.ImageHash]] = (
+            OrderedDict()
+        )
+
+    def applicable(self, image: MatLike, template: MatLike) -> bool:
+        """
+        imageがtemplateとほぼ同じ大きさ(位置が決まっている判定)かを返す。
+        """
+        height, width = template.shape[:2]
+        return height <= image.shape[0] <= height * (
+            1 + self.max_slack
+        ) and width <= image.shape[1] <= width * (1 + self.max_slack)
+
+    def distance(self, image: MatLike, template: MatLike) -> int:
+        """
+        imageとtemplateのハッシュのハミング距離を返す。
+        """
+        return image_hash(image, self.method, self.hash_size) - self.__template_hash(
+            template,
+        )
+
+    def rejects(self, image: MatLike, template: MatLike) -> bool:
+        """
+        テンプレートマッチングを省略してよい(明らかに一致しない)場合にTrueを返す。
+        判定できない大きさの場合はFalseを返す。
+        """
+        if not self.applicable(image, template):
+            return False
+        rejected = self.distance(image, template) > self.reject_distance
+        with self.__lock:
+            self.checked += 1
+            if rejected:
+                self.rejected += 1
+        return rejected
+
+    def audit_due(self) -> bool:
+        """
+        直前に省略した判定をテンプレートマッチングで確認する順番であればTrueを返す。
+        """
+        return self.audit_interval > 0 and self.rejected % self.audit_interval == 0
+
+    def record_audit(self, matched: bool, max_val: float) -> None:
+        """
+        省略した判定をテンプレートマッチングで確認した結果を記録する。
+        """
+        with self.__lock:
+            self.audited += 1
+            if matched:
+                self.false_rejects += 1
+        if matched:
+            self._logger.warning(
+                f"Hash prefilter rejected a match (value: {max_val}). "
+                "Consider increasing reject_distance.",
+            )
+        self._logger.debug(f"Hash prefilter: {self.stats()}")
+
+    def stats(self) -> PrefilterStats:
+        return PrefilterStats(
+            self.checked,
+            self.rejected,
+            self.audited,
+            self.false_rejects,
+        )
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.checked = 0
+            self.rejected = 0
+            self.audited = 0
+            self.false_rejects = 0
+            self.__hashes.clear()
+
+    def __template_hash(self, template: MatLike) -> imagehash.ImageHash:
+        key = id(template)
+        with self.__lock:
+            entry = self.__hashes.get(key)
+            if entry is not None and entry[0] is template:
+                self.__hashes.move_to_end(key)
+                return entry[1]
+        template_hash = image_hash(template, self.method, self.hash_size)
+        with self.__lock:
+            self.__hashes[key] = (template, template_hash)
+            while len(self.__hashes) > self.max_entries:
+                self.__hashes.popitem(last=False)
+        return template_hash
@@ -1,20 +1,49 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging import DEBUG, Logger, NullHandler, getLogger
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
 import cv2
-from numpy import argmax, array, ndarray
+from ImageWriter import get_encode_params, get_image_writer
+from numpy import (
+    absolute,
+    argmax,
+    argsort,
+    array,
+    count_nonzero,
+    empty,
+    float32,
+    isfinite,
+    ndarray,
+    nonzero,
+    searchsorted,
+    zeros,
+)
 
 if TYPE_CHECKING:
-    from collections.abc import Sequence
-    from typing import Final, Literal
+    from collections.abc import Hashable, Sequence
+    from types import ModuleType
+    from typing import Any, Final, Literal
 
     from cv2.typing import MatLike
+    from HashPrefilter import HashPrefilter
 
     type CropFmt = int | Literal["", "1", "2", "3", "4", "11", "12", "13", "14"]
+    type ColorSpace = Literal["BGR", "HSV", "GRAY"]
+    type MatchEngine = Literal["opencv", "numba"]
+    type HistogramMethod = Literal[
+        "bhattacharyya",
+        "chisqr",
+        "correlation",
+        "intersect",
+    ]
 
 
 def crop_image(image: MatLike, crop: list[int] | None = None) -> MatLike:
@@ -141,6 +170,259 @@ def getImage(
         return None
 
 
+def _crop_key(crop: list[int] | None) -> tuple[int, ...] | None:
+    """
+    crop_imageと同じ解釈でトリミング範囲をキャッシュのキーに変換する(Noneは画像全体)
+    """
+    if crop is None or len(crop) < 4:
+        return None
+    return tuple(crop[:4])
+
+
+def _readonly(image: MatLike) -> MatLike:
+    image.flags.writeable = False
+    return image
+
+
+class FrameCache:
+    """
+    1フレームから派生する画像(グレースケール/HSV/縮小画像)を必要になった時点で生成して保持する。
+
+    同じフレームに対する複数回のテンプレートマッチングで色変換を繰り返さないために使う。
+    画像全体を変換済みであればその切り出しを返し、未変換であれば指定範囲だけを変換して保持する。
+    返す画像は読み取り専用。
+    """
+
+    def __init__(self, frame: MatLike, seq: int = 0) -> None:
+        self.frame: MatLike = frame
+        self.seq: int = seq
+        self.__gray: dict[tuple[int, ...] | None, MatLike] = {}
+        self.__hsv: dict[tuple[int, ...] | None, MatLike] = {}
+        self.__pyramid: list[MatLike] = []
+
+    def gray(self, crop: list[int] | None = None) -> MatLike:
+        """
+        グレースケール画像を返す。cropはcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]。
+        """
+        return self.__converted(self.__gray, cv2.COLOR_BGR2GRAY, crop)
+
+    def hsv(self, crop: list[int] | None = None) -> MatLike:
+        """
+        HSV画像を返す。cropはcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]。
+        """
+        return self.__converted(self.__hsv, cv2.COLOR_BGR2HSV, crop)
+
+    def region(
+        self,
+        crop: list[int] | None = None,
+        color_space: ColorSpace = "BGR",
+    ) -> MatLike:
+        """
+        cropの範囲をcolor_space("BGR"/"HSV"/"GRAY")の画像で返す。
+        """
+        if color_space == "HSV":
+            return self.hsv(crop)
+        if color_space == "GRAY":
+            return self.gray(crop)
+        return _readonly(crop_image(self.frame, crop=crop))
+
+    def pyramid(self, level: int) -> MatLike:
+        """
+        グレースケール画像を1/2**levelに縮小した画像を返す(level=0は等倍、1は1/2、2は1/4)。
+        """
+        if not self.__pyramid:
+            self.__pyramid.append(self.gray())
+        while len(self.__pyramid) <= level:
+            self.__pyramid.append(_readonly(cv2.pyrDown(self.__pyramid[-1])))
+        return self.__pyramid[level]
+
+    def __converted(
+        self,
+        store: dict[tuple[int, ...] | None, MatLike],
+        code: int,
+        crop: list[int] | None,
+    ) -> MatLike:
+        key = _crop_key(crop)
+        if None in store:
+            return crop_image(store[None], crop=crop)
+        if key not in store:
+            src = crop_image(self.frame, crop=crop)
+            store[key] = _readonly(cv2.cvtColor(src, code))
+        return store[key]
+
+
+class HitStats(NamedTuple):
+    """
+    TemplateTracker/ChangeGateの集計値。
+    TemplateTrackerではhitsは前回位置の周辺で見つかった回数、missesは探索範囲全体を探索した回数。
+    ChangeGateではhitsは前回の結果を再利用した回数、missesはテンプレートマッチングを行った回数。
+    """
+
+    hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"hits={self.hits} misses={self.misses} hit_rate={self.hit_rate:.1%}"
+
+
+class TemplateTracker:
+    """
+    テンプレートごとに前回見つかった位置を保持し、次回はその周辺(margin画素広げた範囲)だけを探索させる。
+
+    位置と範囲はフレーム全体の座標で扱い、範囲はcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]。
+    """
+
+    def __init__(self, margin: int = 16, max_entries: int = 256) -> None:
+        self.margin: int = margin
+        self.max_entries: int = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        # キー: (x, y, 幅, 高さ)
+        self.__locations: OrderedDict[Hashable, tuple[int, int, int, int]] = (
+            OrderedDict()
+        )
+
+    def window(
+        self,
+        key: Hashable,
+        region: list[int],
+    ) -> list[int] | None:
+        """
+        前回の位置の周辺をregionの範囲内に収めて返す。前回の位置がない場合はNone。
+        """
+        location = self.__locations.get(key)
+        if location is None:
+            return None
+        x, y, width, height = location
+        y0, y1, x0, x1 = region
+        window = [
+            max(y0, y - self.margin),
+            min(y1, y + height + self.margin),
+            max(x0, x - self.margin),
+            min(x1, x + width + self.margin),
+        ]
+        if window[1] - window[0] < height or window[3] - window[2] < width:
+            return None
+        return window
+
+    def hit(self, key: Hashable, location: tuple[int, int, int, int]) -> None:
+        """
+        前回の位置の周辺で見つかった場合に呼ぶ。
+        """
+        self.hits += 1
+        self.__store(key, location)
+
+    def miss(self, key: Hashable, location: tuple[int, int, int, int] | None) -> None:
+        """
+        探索範囲全体を探索した場合に呼ぶ。見つからなかった場合はlocationにNoneを渡す。
+        """
+        self.misses += 1
+        if location is None:
+            self.__locations.pop(key, None)
+        else:
+            self.__store(key, location)
+
+    def stats(self) -> HitStats:
+        return HitStats(self.hits, self.misses)
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.__locations.clear()
+
+    def __store(self, key: Hashable, location: tuple[int, int, int, int]) -> None:
+        self.__locations[key] = location
+        self.__locations.move_to_end(key)
+        while len(self.__locations) > self.max_entries:
+            self.__locations.popitem(last=False)
+
+
+class ChangeGate[T]:
+    """
+    探索範囲の画像が前回の評価時から変化していない場合に、前回の結果を再利用するためのキャッシュ。
+
+    範囲の画像を縦横size画素に縮小した指紋を比較し、すべての画素で値の差がtolerance以下であれば変化なしとみなす。
+    範囲全体の平均では広い範囲の中の小さな変化(アイコンの表示など)を見逃すため、最も差の大きい画素で判定する。
+    depsには結果に影響する画像(テンプレート画像など)を渡し、前回と同一のオブジェクトでなければ再評価させる。
+    """
+
+    def __init__(
+        self,
+        tolerance: float = 8.0,
+        size: int = 32,
+        max_entries: int = 256,
+    ) -> None:
+        self.tolerance: float = tolerance
+        self.size: int = size
+        self.max_entries: int = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__entries: OrderedDict[
+            Hashable,
+            tuple[MatLike, tuple[object, ...], T],
+        ] = OrderedDict()
+
+    def fingerprint(self, image: MatLike) -> MatLike:
+        """
+        探索範囲の画像から比較用の縮小画像を作る。
+        大きな画像は縮小後の1画素あたり4画素程度になるよう間引いてから平均する。
+        """
+        step = max(1, min(image.shape[0], image.shape[1]) // (self.size * 4))
+        return cv2.resize(
+            image[::step, ::step],
+            (self.size, self.size),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    def get(
+        self,
+        key: Hashable,
+        fingerprint: MatLike,
+        deps: tuple[object, ...] = (),
+    ) -> T | None:
+        """
+        変化していなければ前回の結果を返す。変化している場合はNoneを返す。
+        """
+        entry = self.__entries.get(key)
+        if (
+            entry is not None
+            and entry[0].shape == fingerprint.shape
+            and len(entry[1]) == len(deps)
+            and all(a is b for a, b in zip(entry[1], deps, strict=True))
+            and float(cv2.norm(entry[0], fingerprint, cv2.NORM_INF)) <= self.tolerance
+        ):
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        key: Hashable,
+        fingerprint: MatLike,
+        deps: tuple[object, ...],
+        result: T,
+    ) -> None:
+        self.__entries[key] = (fingerprint, deps, result)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+
+    def stats(self) -> HitStats:
+        return HitStats(self.hits, self.misses)
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.__entries.clear()
+
+
 def doPreprocessImage(
     image: MatLike,
     use_gray: bool = True,
@@ -148,15 +430,20 @@ def doPreprocessImage(
     BGR_range: dict[Literal["lower", "upper"], int | tuple[int, int, int]]
     | None = None,
     threshold_binary: int | None = None,
+    cache: FrameCache | None = None,
 ) -> tuple[MatLike, int, int]:
     """
     画像をトリミングしてグレースケール化/2値化する
+    cacheにimageのFrameCacheを渡した場合、グレースケール画像はキャッシュから取得する
     2値化関連のContributor: mikan kochan 空太 (敬称略)
     """
     src = crop_image(image, crop=crop)  # トリミング
 
     if use_gray:
-        src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)  # グレースケール化
+        if cache is not None:
+            src = cache.gray(crop)
+        else:
+            src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)  # グレースケール化
     elif BGR_range is not None:  # 2値化
         src = cv2.inRange(
             src,
@@ -173,6 +460,116 @@ def doPreprocessImage(
     return src, width, height
 
 
+def _is_binary(
+    use_gray: bool,
+    BGR_range: dict[Literal["lower", "upper"], int | tuple[int, int, int]] | None,
+    threshold_binary: int | None,
+) -> bool:
+    """
+    doPreprocessImageの結果が2値画像(0と255)になるかを返す
+    """
+    return threshold_binary is not None or (not use_gray and BGR_range is not None)
+
+
+def _coarse_image(
+    cache: FrameCache | None,
+    level: int,
+    use_gray: bool,
+    crop: list[int] | None,
+    threshold_binary: int | None,
+) -> MatLike | None:
+    """
+    前処理後の画像がフレーム全体のグレースケール画像と一致する場合に、FrameCacheの縮小画像を返す
+    """
+    if (
+        cache is None
+        or level <= 0
+        or not use_gray
+        or threshold_binary is not None
+        or _crop_key(crop) is not None
+    ):
+        return None
+    return cache.pyramid(level)
+
+
+# compare_histogramで指定できる比較方式
+HISTOGRAM_METHODS: Final = {
+    "bhattacharyya": cv2.HISTCMP_BHATTACHARYYA,
+    "chisqr": cv2.HISTCMP_CHISQR,
+    "correlation": cv2.HISTCMP_CORREL,
+    "intersect": cv2.HISTCMP_INTERSECT,
+}
+
+
+def calc_mean_color(image: MatLike) -> tuple[float, ...]:
+    """
+    チャンネルごとの画素値の平均を返す
+    """
+    channels = image.shape[2] if image.ndim == 3 else 1
+    return tuple(cv2.mean(image)[:channels])
+
+
+def calc_median_color(image: MatLike) -> tuple[float, ...]:
+    """
+    チャンネルごとの画素値の中央値を返す(8bit画像のみ)
+    ヒストグラムの累積から求めるため、画素を並べ替えるよりも速い
+    """
+    channels = image.shape[2] if image.ndim == 3 else 1
+    half = image.shape[0] * image.shape[1] / 2
+    medians: list[float] = []
+    for channel in range(channels):
+        hist = cv2.calcHist([image], [channel], None, [256], [0, 256])
+        medians.append(float(searchsorted(hist.ravel().cumsum(), half)))
+    return tuple(medians)
+
+
+def calc_color_ratio(
+    image: MatLike,
+    lower: int | Sequence[int],
+    upper: int | Sequence[int],
+) -> float:
+    """
+    画素値がlower以上upper以下(チャンネルごと)の画素の割合を返す
+    """
+    if image.size == 0:
+        return 0.0
+    mask = cv2.inRange(image, array(lower), array(upper))
+    return cv2.countNonZero(mask) / (image.shape[0] * image.shape[1])
+
+
+def calc_color_histogram(
+    image: MatLike,
+    color_space: ColorSpace = "HSV",
+    bins: int = 16,
+) -> MatLike:
+    """
+    全チャンネルの多次元ヒストグラムを合計が1になるように正規化して返す
+    """
+    channels = image.shape[2] if image.ndim == 3 else 1
+    # HSVの色相は0-179
+    ranges = [0, 180, 0, 256, 0, 256] if color_space == "HSV" else [0, 256] * channels
+    hist = cv2.calcHist(
+        [image],
+        list(range(channels)),
+        None,
+        [bins] * channels,
+        ranges[: channels * 2],
+    )
+    return cv2.normalize(hist, hist, 1.0, 0.0, cv2.NORM_L1)
+
+
+def compare_histogram(
+    hist: MatLike,
+    reference: MatLike,
+    method: HistogramMethod = "bhattacharyya",
+) -> float:
+    """
+    calc_color_histogramで求めたヒストグラムを比較する
+    bhattacharyya/chisqrは似ているほど小さく(同じなら0)、correlation/intersectは似ているほど大きい(同じなら1)
+    """
+    return cv2.compareHist(hist, reference, HISTOGRAM_METHODS[method])
+
+
 def opneImage(
     image: MatLike,
     crop: list[int] | None = None,
@@ -188,9 +585,106 @@ def opneImage(
     cv2.destroyAllWindows()
 
 
+# ピラミッド照合で縮小後のテンプレートに必要な最小サイズ(これより小さくなる場合は等倍で照合する)
+PYRAMID_MIN_TEMPLATE_SIZE = 8
+
+
+class PyramidCheck(NamedTuple):
+    """
+    通常の照合とピラミッド照合の比較結果(check_pyramid_accuracyの戻り値)
+    """
+
+    exact_val: float
+    exact_loc: tuple[int, int]
+    pyramid_val: float
+    pyramid_loc: tuple[int, int]
+    exact_ms: float
+    pyramid_ms: float
+    agrees: bool
+
+
+class EngineCheck(NamedTuple):
+    """
+    matchTemplateとnumbaの照合の比較結果(check_match_engineの戻り値)
+    """
+
+    opencv_val: float
+    opencv_loc: tuple[int, int]
+    numba_val: float
+    numba_loc: tuple[int, int]
+    opencv_ms: float
+    numba_ms: float
+    applicable: bool
+    agrees: bool
+
+
+class TemplateHit(NamedTuple):
+    """
+    find_allで見つかったテンプレートの位置(左上)とサイズ、類似度
+    """
+
+    x: int
+    y: int
+    width: int
+    height: int
+    score: float
+
+
+# find_peaksで閾値を超えた点がこれより多い場合は、先に極大点だけに絞り込む
+PEAK_DILATE_CANDIDATES = 4096
+
+
+def find_peaks(
+    response: MatLike,
+    threshold: float,
+    min_distance: int = 1,
+    max_results: int | None = None,
+) -> tuple[ndarray, ndarray, ndarray]:
+    """
+    matchTemplateの結果から閾値を超える点を類似度の高い順に取り出し、(x座標, y座標, 類似度)の配列を返す
+    取り出した点から縦横ともmin_distance画素以内にある点は同じ物体とみなして除外する(非最大値抑制)
+    """
+    if min_distance < 1:
+        msg = f"min_distance:{min_distance}は1以上を指定してください。"
+        raise ValueError(msg)
+    candidates = response > threshold
+    if count_nonzero(candidates) > PEAK_DILATE_CANDIDATES:
+        # 閾値が低く候補が多い場合は、近傍の最大値と一致する点(極大点)だけを候補にする
+        kernel = cv2.getStructuringElement(
+            cv2.MORPH_RECT,
+            (2 * min_distance + 1, 2 * min_distance + 1),
+        )
+        candidates &= response >= cv2.dilate(response, kernel)
+    ys, xs = nonzero(candidates)
+    scores = response[ys, xs]
+    # マスク使用時に出る無限大などは除外する
+    finite = isfinite(scores)
+    ys, xs, scores = ys[finite], xs[finite], scores[finite]
+
+    # 類似度の高い順に採用し、採用した点の近傍をまとめて除外する
+    order = argsort(-scores, kind="stable")
+    ys, xs, scores = ys[order], xs[order], scores[order]
+    suppressed = zeros(len(scores), dtype=bool)
+    keep: list[int] = []
+    for index in range(len(scores)):
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        if max_results is not None and len(keep) >= max_results:
+            break
+        suppressed |= (absolute(xs - xs[index]) <= min_distance) & (
+            absolute(ys - ys[index]) <= min_distance
+        )
+    return xs[keep], ys[keep], scores[keep]
+
+
 class ImageProcessing:
     """
     画像に関する処理を行う。
+
+    テンプレートマッチングの結果を書き込む配列(およびGPU使用時のマッチャー)をインスタンスが保持して使い回すため、
+    get_image_processing()で取得した共有インスタンスを使うことを推奨する。
+    結果の配列はスレッドごとに保持するので、複数スレッドから同時に呼び出せる。
     """
 
     __logger: Logger
@@ -201,7 +695,15 @@ class ImageProcessing:
     __use_gpu = False
     image_type: Final = ndarray
 
-    def __init__(self, use_gpu: bool = False) -> None:
+    def __init__(self, use_gpu: bool = False, max_result_buffers: int = 32) -> None:
+        # テンプレートマッチングの結果を書き込む配列((画像サイズ, テンプレートサイズ)ごと、スレッドごと)
+        self.max_result_buffers: int = max_result_buffers
+        self.__local: threading.local = threading.local()
+        # GPU使用時のマッチャー(比較方式ごと)
+        self.__gmatchers: dict[int, Any] = {}
+        # 小さなテンプレートの照合に使うnumbaの照合(match_engine="numba"の場合のみ読み込む)
+        self.match_engine: MatchEngine = "opencv"
+        self.__kernels: ModuleType | None = None
         # ロガーを起動する(1回だけ)
         if not self.__activate_logger:
             self.__logger = getLogger(__name__)
@@ -253,16 +755,58 @@ class ImageProcessing:
             self.__logger.error(f"Image Write Error: {e}")
             return False
 
+    def set_match_engine(self, engine: MatchEngine) -> None:
+        """
+        テンプレートマッチングの方式を設定する
+        "numba"では小さなテンプレート(縦横KERNEL_MAX_TEMPLATE_SIZE以下)を狭い範囲で探す場合に、
+        numbaでコンパイルした照合を使う(類似度はmatchTemplateと同じ。それ以外の場合とGPU使用時はmatchTemplateを使う)
+        """
+        if engine == "opencv":
+            self.__kernels = None
+        elif engine == "numba":
+            # numbaの読み込みは時間がかかるため、使う場合だけ読み込む
+            import MatchKernels  # noqa: PLC0415
+
+            if not MatchKernels.flag_import_numba:
+                msg = "numbaをインポートできませんでした。numbaをインストールしてください。"
+                raise RuntimeError(msg)
+            self.__kernels = MatchKernels
+        else:
+            msg = f"engine:{engine}は'opencv'または'numba'を指定してください。"
+            raise ValueError(msg)
+        self.match_engine = engine
+
     def doTemplateMatch(
         self,
         image: MatLike,
         template_image: MatLike,
         mask_image: MatLike | None = None,
+        pyramid_level: int = 0,
+        pyramid_candidates: int = 3,
+        coarse_image: MatLike | None = None,
+        binary: bool = False,
     ) -> tuple[float, Sequence[int]]:
         """
         テンプレートマッチングをする
         画像は必要に応じて事前にグレースケール化やトリミングをしておく必要がある
+        pyramid_levelが1以上の場合は1/2**pyramid_levelに縮小した画像で類似度の高い候補をpyramid_candidates個探し、
+        候補の周辺だけを等倍で照合する(GPU使用時、テンプレートが小さすぎる場合は通常の照合を行う)
+        coarse_imageに縮小済みのimageを渡すと縮小を省略する
+        binaryには画像が2値化済みかを渡す(match_engine="numba"で2値画像用の照合を使う)
         """
+        # 小さなテンプレートを狭い範囲で探す場合はnumbaで照合する(match_engine="numba"の場合)
+        if (
+            self.__kernels is not None
+            and not self.__use_gpu
+            and self.__kernels.kernel_applicable(
+                image,
+                template_image,
+                mask_image,
+                binary,
+            )
+        ):
+            return self.__kernels.match_small(image, template_image, binary)
+
         # 比較方式を設定する
         method = (
             cv2.TM_CCORR_NORMED
@@ -270,22 +814,257 @@ class ImageProcessing:
             else cv2.TM_CCOEFF_NORMED
         )
 
+        if pyramid_level > 0 and not self.__use_gpu:
+            matched = self.__pyramid_match(
+                image,
+                template_image,
+                mask_image,
+                method,
+                pyramid_level,
+                pyramid_candidates,
+                coarse_image,
+            )
+            if matched is not None:
+                return matched
+
         # テンプレートマッチングをする
+        res = self.__match_response(image, template_image, mask_image, method)
+        _, max_val, _, max_loc = cv2.minMaxLoc(
+            res,
+        )  # 結果から類似度と類似度が最大となる場所を抽出
+
+        return max_val, max_loc
+
+    def __match_response(
+        self,
+        image: MatLike,
+        template_image: MatLike,
+        mask_image: MatLike | None,
+        method: int,
+    ) -> MatLike:
+        """
+        テンプレートマッチングを行い、位置ごとの類似度の配列を返す
+        CPU使用時は使い回している配列を返すため、次の照合までに使い終える必要がある
+        """
         if self.__use_gpu:  # GPUを使用する場合(マスク非対応)
             print("template matching mode:GPU")
             self.__gsrc.upload(image)  # pyright: ignore[reportOptionalMemberAccess]
             self.__gtmpl.upload(template_image)  # pyright: ignore[reportOptionalMemberAccess]
-            matcher = cv2.cuda.createTemplateMatching(cv2.CV_8UC1, method)  # pyright: ignore[reportAttributeAccessIssue,reportUnknownVariableType]
-            self.__gresult = matcher.match(self.__gsrc, self.__gtmpl)
-            res = self.__gresult.download()  # pyright: ignore[reportUnknownVariableType]
-        else:
-            res = cv2.matchTemplate(image, template_image, method, mask=mask_image)
-        _, max_val, _, max_loc = cv2.minMaxLoc(
-            res,  # pyright: ignore[reportUnknownArgumentType]
-        )  # 結果から類似度と類似度が最大となる場所を抽出
+            matcher = self.__gmatchers.get(method)
+            if matcher is None:
+                matcher = cv2.cuda.createTemplateMatching(cv2.CV_8UC1, method)  # pyright: ignore[reportAttributeAccessIssue,reportUnknownVariableType]
+                self.__gmatchers[method] = matcher
+            self.__gresult = matcher.match(self.__gsrc, self.__gtmpl, self.__gresult)  # pyright: ignore[reportUnknownMemberType]
+            return self.__gresult.download()  # pyright: ignore[reportUnknownVariableType]
+        return cv2.matchTemplate(
+            image,
+            template_image,
+            method,
+            result=self.__result_buffer(image, template_image),
+            mask=mask_image,
+        )
 
+    def __pyramid_match(
+        self,
+        image: MatLike,
+        template_image: MatLike,
+        mask_image: MatLike | None,
+        method: int,
+        level: int,
+        candidates: int,
+        coarse_image: MatLike | None,
+    ) -> tuple[float, tuple[int, int]] | None:
+        """
+        縮小画像で候補位置を探してから等倍で照合する。縮小画像で照合できない場合はNoneを返す。
+        """
+        scale = 2**level
+        height, width = template_image.shape[:2]
+        if min(height, width) // scale < PYRAMID_MIN_TEMPLATE_SIZE:
+            return None
+        small_template = template_image
+        for _ in range(level):
+            small_template = cv2.pyrDown(small_template)
+        if coarse_image is None:
+            coarse_image = image
+            for _ in range(level):
+                coarse_image = cv2.pyrDown(coarse_image)
+        small_height, small_width = small_template.shape[:2]
+        if coarse_image.shape[0] < small_height or coarse_image.shape[1] < small_width:
+            return None
+        small_mask = (
+            None
+            if mask_image is None
+            else cv2.resize(
+                mask_image,
+                (small_width, small_height),
+                interpolation=cv2.INTER_NEAREST,
+            )
+        )
+        res = cv2.matchTemplate(
+            coarse_image,
+            small_template,
+            method,
+            result=self.__result_buffer(coarse_image, small_template),
+            mask=small_mask,
+        )
+
+        # 類似度の高い順に候補を取り出す(同じ物体を重複して取り出さないよう周辺を除外する)
+        points: list[tuple[int, int]] = []
+        for _ in range(max(1, candidates)):
+            _, val, _, (x, y) = cv2.minMaxLoc(res)
+            if not math.isfinite(val):
+                break
+            points.append((x, y))
+            res[
+                max(0, y - small_height // 2) : y + small_height // 2 + 1,
+                max(0, x - small_width // 2) : x + small_width // 2 + 1,
+            ] = -math.inf
+        if not points:
+            return None
+
+        # 候補の周辺を等倍で照合する(縮小による位置ずれを吸収するため余白を設ける)
+        margin = 2 * scale
+        image_height, image_width = image.shape[:2]
+        max_val = -math.inf
+        max_loc = (0, 0)
+        for x, y in points:
+            x0 = max(0, min(x * scale - margin, image_width - width))
+            y0 = max(0, min(y * scale - margin, image_height - height))
+            x1 = min(image_width, x * scale + width + margin)
+            y1 = min(image_height, y * scale + height + margin)
+            window = image[y0:y1, x0:x1]
+            res = cv2.matchTemplate(
+                window,
+                template_image,
+                method,
+                result=self.__result_buffer(window, template_image),
+                mask=mask_image,
+            )
+            _, val, _, (loc_x, loc_y) = cv2.minMaxLoc(res)
+            if val > max_val:
+                max_val = val
+                max_loc = (x0 + loc_x, y0 + loc_y)
         return max_val, max_loc
 
+    def check_pyramid_accuracy(
+        self,
+        image: MatLike,
+        template_image: MatLike,
+        mask_image: MatLike | None = None,
+        pyramid_level: int = 1,
+        pyramid_candidates: int = 3,
+        tolerance: int = 1,
+    ) -> PyramidCheck:
+        """
+        同じ画像に対して通常の照合とピラミッド照合を行い、結果と所要時間を比較する。
+        位置の差がtolerance画素以内かつ類似度の差が0.01以内であればagreesがTrueになる。
+        pyramid_levelを使う前に、実際の画面とテンプレートで精度を確認するために使う。
+        """
+        start = time.perf_counter()
+        exact_val, exact_loc = self.doTemplateMatch(image, template_image, mask_image)
+        middle = time.perf_counter()
+        pyramid_val, pyramid_loc = self.doTemplateMatch(
+            image,
+            template_image,
+            mask_image,
+            pyramid_level=pyramid_level,
+            pyramid_candidates=pyramid_candidates,
+        )
+        end = time.perf_counter()
+        agrees = (
+            abs(exact_loc[0] - pyramid_loc[0]) <= tolerance
+            and abs(exact_loc[1] - pyramid_loc[1]) <= tolerance
+            and abs(exact_val - pyramid_val) <= 0.01
+        )
+        return PyramidCheck(
+            exact_val,
+            (exact_loc[0], exact_loc[1]),
+            pyramid_val,
+            (pyramid_loc[0], pyramid_loc[1]),
+            (middle - start) * 1000,
+            (end - middle) * 1000,
+            agrees,
+        )
+
+    def check_match_engine(
+        self,
+        image: MatLike,
+        template_image: MatLike,
+        binary: bool = False,
+        repeat: int = 100,
+    ) -> EngineCheck:
+        """
+        同じ画像に対してmatchTemplateとnumbaの照合をそれぞれrepeat回行い、結果と1回あたりの所要時間を比較する。
+        applicableはmatch_engine="numba"でnumbaの照合が使われる条件を満たすか、
+        agreesは位置が一致し類似度の差が0.001以内か。match_engineを変える前に、実際の画面とテンプレートで速さを確認するために使う。
+        """
+        import MatchKernels  # noqa: PLC0415
+
+        if not MatchKernels.flag_import_numba:
+            msg = "numbaをインポートできませんでした。numbaをインストールしてください。"
+            raise RuntimeError(msg)
+        repeat = max(1, repeat)
+        method = cv2.TM_CCOEFF_NORMED
+        # 結果は計測の前に1回ずつ求める(numbaの初回はコンパイルまたはキャッシュの読み込みを行うため計測から除く)
+        numba_val, numba_loc = MatchKernels.match_small(image, template_image, binary)
+        _, opencv_val, _, opencv_loc = cv2.minMaxLoc(
+            self.__match_response(image, template_image, None, method),
+        )
+        start = time.perf_counter()
+        for _ in range(repeat):
+            cv2.minMaxLoc(self.__match_response(image, template_image, None, method))
+        middle = time.perf_counter()
+        for _ in range(repeat):
+            MatchKernels.match_small(image, template_image, binary)
+        end = time.perf_counter()
+        agrees = (
+            opencv_loc[0] == numba_loc[0]
+            and opencv_loc[1] == numba_loc[1]
+            and abs(opencv_val - numba_val) <= 0.001
+        )
+        return EngineCheck(
+            opencv_val,
+            (opencv_loc[0], opencv_loc[1]),
+            numba_val,
+            (numba_loc[0], numba_loc[1]),
+            (middle - start) * 1000 / repeat,
+            (end - middle) * 1000 / repeat,
+            MatchKernels.kernel_applicable(image, template_image, binary=binary),
+            agrees,
+        )
+
+    def __result_buffer(
+        self,
+        image: MatLike,
+        template_image: MatLike,
+    ) -> MatLike | None:
+        """
+        matchTemplateの結果を書き込む配列を返す。同じサイズの組み合わせでは同じ配列を使い回す。
+        """
+        height = image.shape[0] - template_image.shape[0] + 1
+        width = image.shape[1] - template_image.shape[1] + 1
+        if height <= 0 or width <= 0:
+            # テンプレートの方が大きい場合はmatchTemplateにエラーを出させる
+            return None
+        buffers: OrderedDict[tuple[int, int], MatLike] | None = getattr(
+            self.__local,
+            "buffers",
+            None,
+        )
+        if buffers is None:
+            buffers = OrderedDict()
+            self.__local.buffers = buffers
+        key = (height, width)
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = empty((height, width), dtype=float32)
+            buffers[key] = buffer
+            while len(buffers) > self.max_result_buffers:
+                buffers.popitem(last=False)
+        else:
+            buffers.move_to_end(key)
+        return buffer
+
     def isContainTemplate(
         self,
         image: MatLike,
@@ -299,9 +1078,20 @@ class ImageProcessing:
         threshold_binary: int | None = None,
         crop_template: list[int] | None = None,
         show_image: bool = False,
+        frame_cache: FrameCache | None = None,
+        template_cache: FrameCache | None = None,
+        preprocessed_template: tuple[MatLike, int, int] | None = None,
+        pyramid_level: int = 0,
+        prefilter: HashPrefilter | None = None,
     ) -> tuple[bool, Sequence[int], int, int, float]:
         """
         テンプレートマッチングを行い類似度が閾値を超えているかを確認する
+        frame_cache/template_cacheにimage/template_imageのFrameCacheを渡すとグレースケール変換を共有する
+        preprocessed_templateに前処理済みのテンプレート画像(画像, 幅, 高さ)を渡すとテンプレート画像の加工を省略する
+        pyramid_levelを1以上にすると縮小画像で候補を絞ってから照合する(doTemplateMatchを参照)
+        prefilterを渡すと、探索範囲がテンプレートとほぼ同じ大きさの場合に知覚ハッシュで明らかに一致しないものを除外する
+        (除外した場合はテンプレートマッチングを行わず、類似度は-inf、位置は(0, 0)となる)
+        マスク画像を使う場合はマスクで除いた部分もハッシュに含まれるため、prefilterは使わない
         """
         # テンプレートマッチング対象画像を加工する
         src, _, _ = doPreprocessImage(
@@ -310,6 +1100,7 @@ class ImageProcessing:
             crop=crop,
             BGR_range=BGR_range,
             threshold_binary=threshold_binary,
+            cache=frame_cache,
         )
 
         # [DEBUG] テンプレートマッチング対象画像を表示する
@@ -318,19 +1109,107 @@ class ImageProcessing:
             cv2.waitKey()
 
         # テンプレート画像を加工する
-        template, width, height = doPreprocessImage(
-            template_image,
+        if preprocessed_template is not None:
+            template, width, height = preprocessed_template
+        else:
+            template, width, height = doPreprocessImage(
+                template_image,
+                use_gray=use_gray,
+                crop=crop_template,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+                cache=template_cache,
+            )
+
+        # 知覚ハッシュが大きく異なる場合はテンプレートマッチングを省略する(一定の間隔で省略が正しいかを確認する)
+        audit = False
+        if (
+            prefilter is not None
+            and mask_image is None
+            and prefilter.rejects(src, template)
+        ):
+            audit = prefilter.audit_due()
+            if not audit:
+                return False, (0, 0), width, height, -math.inf
+
+        # テンプレートマッチングを行う
+        max_val, max_loc = self.doTemplateMatch(
+            src,
+            template,
+            mask_image=mask_image,
+            pyramid_level=pyramid_level,
+            coarse_image=_coarse_image(
+                frame_cache,
+                pyramid_level,
+                use_gray,
+                crop,
+                threshold_binary,
+            ),
+            binary=_is_binary(use_gray, BGR_range, threshold_binary),
+        )
+        if audit and prefilter is not None:
+            prefilter.record_audit(max_val > threshold, max_val)
+
+        # 類似度が閾値を超えたかを戻り値として返す(合わせて位置とテンプレート画像のサイズも返す)
+        return max_val > threshold, max_loc, width, height, max_val
+
+    def find_all(
+        self,
+        image: MatLike,
+        template_image: MatLike,
+        mask_image: MatLike | None = None,
+        threshold: float = 0.7,
+        min_distance: int | None = None,
+        max_results: int | None = None,
+        use_gray: bool = True,
+        crop: list[int] | None = None,
+        BGR_range: dict[Literal["lower", "upper"], int | tuple[int, int, int]]
+        | None = None,
+        threshold_binary: int | None = None,
+        crop_template: list[int] | None = None,
+        frame_cache: FrameCache | None = None,
+        preprocessed_template: tuple[MatLike, int, int] | None = None,
+    ) -> list[TemplateHit]:
+        """
+        1回のテンプレートマッチングで類似度が閾値を超える位置をすべて探し、類似度の高い順に返す
+        位置はcropの範囲内の座標。min_distance画素以内(縦横とも)の位置は同じ物体とみなす(省略時はテンプレートの短辺の半分)
+        その他の引数はisContainTemplateと同じ
+        """
+        # テンプレートマッチング対象画像を加工する
+        src, _, _ = doPreprocessImage(
+            image,
             use_gray=use_gray,
-            crop=crop_template,
+            crop=crop,
             BGR_range=BGR_range,
             threshold_binary=threshold_binary,
+            cache=frame_cache,
         )
 
-        # テンプレートマッチングを行う
-        max_val, max_loc = self.doTemplateMatch(src, template, mask_image=mask_image)
+        # テンプレート画像を加工する
+        if preprocessed_template is not None:
+            template, width, height = preprocessed_template
+        else:
+            template, width, height = doPreprocessImage(
+                template_image,
+                use_gray=use_gray,
+                crop=crop_template,
+                BGR_range=BGR_range,
+                threshold_binary=threshold_binary,
+            )
 
-        # 類似度が閾値を超えたかを戻り値として返す(合わせて位置とテンプレート画像のサイズも返す)
-        return max_val > threshold, max_loc, width, height, max_val
+        if min_distance is None:
+            min_distance = max(1, min(width, height) // 2)
+        method = (
+            cv2.TM_CCORR_NORMED
+            if isinstance(mask_image, ndarray)
+            else cv2.TM_CCOEFF_NORMED
+        )
+        res = self.__match_response(src, template, mask_image, method)
+        xs, ys, scores = find_peaks(res, threshold, min_distance, max_results)
+        return [
+            TemplateHit(int(x), int(y), width, height, float(score))
+            for x, y, score in zip(xs, ys, scores, strict=True)
+        ]
 
     def isContainTemplate_max(
         self,
@@ -345,9 +1224,20 @@ class ImageProcessing:
         threshold_binary: int | None = None,
         crop_template: list[int] | None = None,
         show_image: bool = False,
+        frame_cache: FrameCache | None = None,
+        preprocessed_template_list: list[tuple[MatLike, int, int] | None] | None = None,
+        pyramid_level: int = 0,
+        parallel: bool = False,
+        stop_on_match: bool = False,
     ) -> tuple[int, list[float], list[Sequence[int]], list[int], list[int], list[bool]]:
         """
         複数のテンプレート画像を用いてそれぞれテンプレートマッチングを行い類似度が最も大きい画像のindexを返す
+        frame_cacheにimageのFrameCacheを渡すとグレースケール変換を共有する
+        preprocessed_template_listには前処理済みのテンプレート画像(画像, 幅, 高さ)をtemplate_image_listと同じ順に渡す(Noneの要素は加工する)
+        pyramid_levelを1以上にすると縮小画像で候補を絞ってから照合する(doTemplateMatchを参照)
+        parallelがTrueの場合は共有のスレッドプールで並列に照合する(GPU使用時は順に照合する)
+        stop_on_matchがTrueの場合は閾値を超えたテンプレートが見つかった時点で打ち切る(照合しなかったテンプレートの類似度は-inf)
+        戻り値の各リストはtemplate_image_listと同じ順
         """
         # パラメータチェックを行う
         if mask_image_list is None or len(mask_image_list) == 0:
@@ -358,13 +1248,6 @@ class ImageProcessing:
             print("The number of template images and mask images don't match. ")
             return -1, [], [], [], [], []
 
-        # ループをまわしてテンプレート画像数分テンプレートマッチングを行う
-        max_val_list: list[float] = []
-        max_loc_list: list[Sequence[int]] = []
-        width_list: list[int] = []
-        height_list: list[int] = []
-        judge_threshold_list: list[bool] = []
-
         # テンプレートマッチング対象画像を加工する
         src, _, _ = doPreprocessImage(
             image,
@@ -372,6 +1255,7 @@ class ImageProcessing:
             crop=crop,
             BGR_range=BGR_range,
             threshold_binary=threshold_binary,
+            cache=frame_cache,
         )
 
         # [DEBUG] テンプレートマッチング対象画像を表示する
@@ -379,29 +1263,75 @@ class ImageProcessing:
             cv2.imshow("image", src)
             cv2.waitKey()
 
-        for template_image, mask_image in zip(
-            template_image_list,
-            mask_image_list_temp,
-            strict=False,
-        ):
+        preprocessed_list = (
+            preprocessed_template_list
+            if preprocessed_template_list is not None
+            else [None] * len(template_image_list)
+        )
+        coarse_image = _coarse_image(
+            frame_cache,
+            pyramid_level,
+            use_gray,
+            crop,
+            threshold_binary,
+        )
+
+        def match(index: int) -> tuple[float, Sequence[int], int, int]:
             # テンプレート画像を加工する
-            template, width, height = doPreprocessImage(
-                template_image,
-                use_gray=use_gray,
-                crop=crop_template,
-                BGR_range=BGR_range,
-                threshold_binary=threshold_binary,
-            )
+            preprocessed = preprocessed_list[index]
+            if preprocessed is not None:
+                template, width, height = preprocessed
+            else:
+                template, width, height = doPreprocessImage(
+                    template_image_list[index],
+                    use_gray=use_gray,
+                    crop=crop_template,
+                    BGR_range=BGR_range,
+                    threshold_binary=threshold_binary,
+                )
             max_val, max_loc = self.doTemplateMatch(
                 src,
                 template,
-                mask_image=mask_image,
+                mask_image=mask_image_list_temp[index],
+                pyramid_level=pyramid_level,
+                coarse_image=coarse_image,
+                binary=_is_binary(use_gray, BGR_range, threshold_binary),
             )
-            max_val_list.append(max_val)
-            max_loc_list.append(max_loc)
-            width_list.append(width)
-            height_list.append(height)
-            judge_threshold_list.append(max_val > threshold)
+            return max_val, max_loc, width, height
+
+        # 照合しなかったテンプレートの結果は類似度-inf、位置(0, 0)、サイズ0とする
+        results: list[tuple[float, Sequence[int], int, int]] = [
+            (-math.inf, (0, 0), 0, 0) for _ in template_image_list
+        ]
+        if parallel and not self.__use_gpu and len(template_image_list) > 1:
+            # 共有のスレッドプールで並列に照合する(matchTemplateの実行中はGILが解放される)
+            executor = get_match_executor()
+            futures = {
+                executor.submit(match, index): index
+                for index in range(len(template_image_list))
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                if stop_on_match and results[index][0] > threshold:
+                    # 未着手の照合を取り消して打ち切る(実行中のものは結果を使わない)
+                    for other in futures:
+                        other.cancel()
+                    break
+        else:
+            # ループをまわしてテンプレート画像数分テンプレートマッチングを行う
+            for index in range(len(template_image_list)):
+                results[index] = match(index)
+                if stop_on_match and results[index][0] > threshold:
+                    break
+
+        max_val_list: list[float] = [result[0] for result in results]
+        max_loc_list: list[Sequence[int]] = [result[1] for result in results]
+        width_list: list[int] = [result[2] for result in results]
+        height_list: list[int] = [result[3] for result in results]
+        judge_threshold_list: list[bool] = [
+            max_val > threshold for max_val in max_val_list
+        ]
 
         return (
             int(argmax(max_val_list)),
@@ -417,13 +1347,21 @@ class ImageProcessing:
         image: MatLike,
         filename: str,
         crop: list[int] | None = None,
+        quality: int | None = None,
+        async_save: bool = False,
     ) -> None:
         """
         画像を保存する。
+        保存形式はfilenameの拡張子で決まり、qualityで圧縮パラメータを指定できる。
+        async_saveがTrueの場合は共有のImageWriterで保存し、すぐに戻る。
         """
         # トリミングを行う
         cropped_image = crop_image(image, crop=crop)
 
+        if async_save:
+            get_image_writer().submit(filename, cropped_image, quality=quality)
+            return
+
         # ファイル名からパスを抽出する
         capture_dir = os.path.dirname(filename)
 
@@ -434,9 +1372,46 @@ class ImageProcessing:
 
         # 画像を保存する
         try:
-            self.imwrite(filename, cropped_image)
+            self.imwrite(
+                filename,
+                cropped_image,
+                get_encode_params(os.path.splitext(filename)[1], quality),
+            )
             self.__logger.debug(f"Capture succeeded: {filename}")
             print("capture succeeded: " + filename)
         except cv2.error as e:
             print("Capture Failed")
             self.__logger.error(f"Capture Failed :{e}")
+
+
+_image_processing: dict[bool, ImageProcessing] = {}
+_image_processing_lock = threading.Lock()
+
+
+def get_image_processing(use_gpu: bool = False) -> ImageProcessing:
+    """
+    プロセス全体で共有するImageProcessingを返す(use_gpuごとに1つ)。
+    """
+    with _image_processing_lock:
+        if use_gpu not in _image_processing:
+            _image_processing[use_gpu] = ImageProcessing(use_gpu=use_gpu)
+        return _image_processing[use_gpu]
+
+
+_match_executor: ThreadPoolExecutor | None = None
+_match_executor_lock = threading.Lock()
+
+
+def get_match_executor() -> ThreadPoolExecutor:
+    """
+    テンプレートマッチングの並列実行に使う共有のスレッドプールを返す。
+    """
+    global _match_executor  # noqa: PLW0603
+    if _match_executor is None:
+        with _match_executor_lock:
+            if _match_executor is None:
+                _match_executor = ThreadPoolExecutor(
+                    max_workers=min(8, os.cpu_count() or 1),
+                    thread_name_prefix="TemplateMatchThread",
+                )
+    return _match_executor
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from logging import DEBUG, NullHandler, getLogger
+from typing import TYPE_CHECKING
+
+import cv2
+
+if TYPE_CHECKING:
+    from logging import Logger
+    from typing import Literal
+
+    from cv2.typing import MatLike
+
+    type QueuePolicy = Literal["block", "drop"]
+
+
+def get_encode_params(ext: str, quality: int | None = None) -> list[int]:
+    """
+    拡張子に応じたcv2.imencodeの圧縮パラメータを返す。
+
+    .png: quality=圧縮レベル(0-9、大きいほど小さく遅い)
+    .jpg/.jpeg: quality=画質(0-100)
+    .webp: quality=画質(1-100、100超で可逆圧縮)
+    """
+    if quality is None:
+        return []
+    ext = ext.lower()
+    if ext == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, quality]
+    if ext in {".jpg", ".jpeg"}:
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if ext == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return []
+
+
+class ImageWriter:
+    """
+    画像の保存(エンコードと書き込み)をワーカースレッドで行う。
+
+    submitは画像を複製してキューに入れるだけで、すぐに戻る。
+    キューが一杯の場合、policy="block"なら空くまで待ち、policy="drop"なら保存せずに破棄する。
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_queue: int = 16,
+        policy: QueuePolicy = "block",
+    ) -> None:
+        self._logger: Logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+        self.policy: QueuePolicy = policy
+        self.written: int = 0
+        self.failed: int = 0
+        self.dropped: int = 0
+        self.__count_lock: threading.Lock = threading.Lock()
+        self.__queue: queue.Queue[tuple[str, MatLike, list[int]]] = queue.Queue(
+            maxsize=max_queue,
+        )
+        self.__workers: list[threading.Thread] = []
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self.__run,
+                name=f"ImageWriterThread-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self.__workers.append(thread)
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        保存待ちの画像数を返す。
+        """
+        return self.__queue.qsize()
+
+    def submit(
+        self,
+        filename: str,
+        image: MatLike,
+        quality: int | None = None,
+    ) -> bool:
+        """
+        画像の保存を予約する。形式はfilenameの拡張子(.png/.jpg/.webpなど)で決まる。
+        破棄した場合はFalseを返す。
+        """
+        params = get_encode_params(os.path.splitext(filename)[1], quality)
+        item = (filename, image.copy(), params)
+        if self.policy == "drop":
+            try:
+                self.__queue.put_nowait(item)
+            except queue.Full:
+                with self.__count_lock:
+                    self.dropped += 1
+                self._logger.warning(f"Image writer queue is full. Dropped: {filename}")
+                return False
+        else:
+            self.__queue.put(item)
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        予約済みの画像がすべて保存されるまで待つ。timeoutまでに終わらなければFalseを返す。
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.__queue.unfinished_tasks > 0:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def __run(self) -> None:
+        while True:
+            filename, image, params = self.__queue.get()
+            try:
+                succeeded = write_image(filename, image, params)
+                with self.__count_lock:
+                    if succeeded:
+                        self.written += 1
+                    else:
+                        self.failed += 1
+                if succeeded:
+                    self._logger.debug(f"Capture succeeded: {filename}")
+                    print("capture succeeded: " + filename)
+                else:
+                    print("Capture Failed")
+            finally:
+                self.__queue.task_done()
+
+
+def write_image(filename: str, image: MatLike, params: list[int]) -> bool:
+    """
+    画像をエンコードして書き込む。保存先ディレクトリがなければ作成する。
+    """
+    _logger = getLogger(__name__)
+    try:
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        result, n = cv2.imencode(os.path.splitext(filename)[1], image, params)
+        if result:
+            with open(filename, mode="w+b") as f:
+                n.tofile(f)
+            return True
+        return False
+    except (cv2.error, OSError) as e:
+        _logger.error(f"Image Write Error: {e}")
+        return False
+
+
+_image_writer: ImageWriter | None = None
+_image_writer_lock = threading.Lock()
+
+
+def get_image_writer() -> ImageWriter:
+    """
+    プロセス全体で共有するImageWriterを返す。
+    """
+    global _image_writer  # noqa: PLW0603
+    if _image_writer is None:
+        with _image_writer_lock:
+            if _image_writer is None:
+                _image_writer = ImageWriter()
+    return _image_writer
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING
+
+from numpy import empty, float32, float64, int64, uint8, zeros
+
+try:
+    from numba import njit
+
+    flag_import_numba = True
+except Exception:
+    njit = None
+    flag_import_numba = False
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from cv2.typing import MatLike
+
+# numbaで照合するテンプレートの最大サイズ(縦横とも。2値画像の照合では1行を32bitに詰め込む)
+KERNEL_MAX_TEMPLATE_SIZE = 20
+# numbaで照合する探索範囲の上限(これより広い場合はmatchTemplateの方が速い)
+# グレースケール画像は探索位置の数とテンプレートの画素数の積、2値画像は探索位置の数で判定する
+KERNEL_MAX_GRAY_WORK = 32768
+KERNEL_MAX_BINARY_POSITIONS = 1024
+
+
+def _normed_score(num: float, norm: float) -> float:
+    """
+    matchTemplate(TM_CCOEFF_NORMED)と同じ方法で相関を正規化する(分母が0に近い場合の扱いも同じ)。
+    """
+    if abs(num) < norm:
+        return num / norm
+    if abs(num) < norm * 1.125:
+        return 1.0 if num > 0 else -1.0
+    return 0.0
+
+
+def _popcount(value: int) -> int:
+    """
+    32bitまでの値の1のビットの数を返す。
+    """
+    value -= (value >> 1) & 0x55555555
+    value = (value & 0x33333333) + ((value >> 2) & 0x33333333)
+    value = (value + (value >> 4)) & 0x0F0F0F0F
+    return ((value * 0x01010101) & 0xFFFFFFFF) >> 24
+
+
+def _gray_kernel(image: MatLike, template: MatLike) -> tuple[float, int, int]:
+    """
+    グレースケール画像のTM_CCOEFF_NORMEDを計算し、最大値と位置(x, y)を返す。
+    結果の配列を作らずに位置ごとの類似度と最大値の探索をまとめて行う。
+    """
+    image_height, image_width = image.shape
+    height, width = template.shape
+    n = height * width
+
+    # テンプレートから平均を引いておく
+    total = 0.0
+    for i in range(height):
+        for j in range(width):
+            total += template[i, j]
+    mean = total / n
+    centered = empty((height, width), dtype=float32)
+    template_norm = 0.0
+    for i in range(height):
+        for j in range(width):
+            value = template[i, j] - mean
+            centered[i, j] = value
+            template_norm += value * value
+    if template_norm == 0.0:
+        # 無地のテンプレートはmatchTemplateと同じくすべての位置で1
+        return 1.0, 0, 0
+    template_norm = math.sqrt(template_norm)
+
+    # 探索範囲の画素値(内側のループをベクトル化できるようfloat32に変換する)と、和と2乗和の積分画像
+    pixels = empty((image_height, image_width), dtype=float32)
+    sums = zeros((image_height + 1, image_width + 1), dtype=float64)
+    squares = zeros((image_height + 1, image_width + 1), dtype=float64)
+    for y in range(image_height):
+        row_sum = 0.0
+        row_square = 0.0
+        for x in range(image_width):
+            value = float(image[y, x])
+            pixels[y, x] = value
+            row_sum += value
+            row_square += value * value
+            sums[y + 1, x + 1] = sums[y, x + 1] + row_sum
+            squares[y + 1, x + 1] = squares[y, x + 1] + row_square
+
+    best = -math.inf
+    best_x = 0
+    best_y = 0
+    for y in range(image_height - height + 1):
+        for x in range(image_width - width + 1):
+            num = float32(0.0)
+            for i in range(height):
+                for j in range(width):
+                    num += pixels[y + i, x + j] * centered[i, j]
+            window_sum = (
+                sums[y + height, x + width]
+                - sums[y, x + width]
+                - sums[y + height, x]
+                + sums[y, x]
+            )
+            window_square = (
+                squares[y + height, x + width]
+                - squares[y, x + width]
+                - squares[y + height, x]
+                + squares[y, x]
+            )
+            variance = max(window_square - window_sum * window_sum / n, 0.0)
+            score = _normed_score(float(num), math.sqrt(variance) * template_norm)
+            if score > best:
+                best = score
+                best_x = x
+                best_y = y
+    return best, best_x, best_y
+
+
+def _binary_kernel(image: MatLike, template: MatLike) -> tuple[float, int, int]:
+    """
+    2値画像(0と0以外)のTM_CCOEFF_NORMEDを計算し、最大値と位置(x, y)を返す。
+    各行をビット列に詰め込み、両方が1の画素数をビット演算で数えて相関を求める。
+    """
+    image_height, image_width = image.shape
+    height, width = template.shape
+    n = height * width
+    mask = (1 << width) - 1
+
+    # テンプレートの各行のビット列と1の画素数
+    template_rows = zeros(height, dtype=int64)
+    template_count = 0
+    for i in range(height):
+        bits = 0
+        for j in range(width):
+            bits <<= 1
+            if template[i, j]:
+                bits |= 1
+                template_count += 1
+        template_rows[i] = bits
+    # numbaは集合を扱えないため比較を並べる
+    if template_count == 0 or template_count == n:  # noqa: PLR1714
+        return 1.0, 0, 0
+    template_norm = math.sqrt(template_count * (n - template_count))
+
+    # 探索範囲の各位置から幅widthのビット列と、1の画素数の積分画像
+    positions_x = image_width - width + 1
+    rows = empty((image_height, positions_x), dtype=int64)
+    counts = zeros((image_height + 1, image_width + 1), dtype=float64)
+    for y in range(image_height):
+        bits = 0
+        row_count = 0.0
+        for x in range(image_width):
+            bits <<= 1
+            if image[y, x]:
+                bits |= 1
+                row_count += 1.0
+            bits &= mask
+            if x >= width - 1:
+                rows[y, x - width + 1] = bits
+            counts[y + 1, x + 1] = counts[y, x + 1] + row_count
+
+    best = -math.inf
+    best_x = 0
+    best_y = 0
+    for y in range(image_height - height + 1):
+        for x in range(positions_x):
+            both = 0
+            for i in range(height):
+                both += _popcount(rows[y + i, x] & template_rows[i])
+            window_count = (
+                counts[y + height, x + width]
+                - counts[y, x + width]
+                - counts[y + height, x]
+                + counts[y, x]
+            )
+            # 相関と分散をn倍した値で正規化する
+            score = _normed_score(
+                n * both - window_count * template_count,
+                math.sqrt(window_count * (n - window_count)) * template_norm,
+            )
+            if score > best:
+                best = score
+                best_x = x
+                best_y = y
+    return best, best_x, best_y
+
+
+if njit is not None:
+    # コンパイル結果はファイルに保存し、次回以降の起動ではコンパイルしない
+    _normed_score = njit(cache=True, nogil=True)(_normed_score)
+    _popcount = njit(cache=True, nogil=True)(_popcount)
+    _gray_kernel = njit(cache=True, nogil=True, fastmath=True)(_gray_kernel)
+    _binary_kernel = njit(cache=True, nogil=True)(_binary_kernel)
+
+
+def kernel_applicable(
+    image: MatLike,
+    template: MatLike,
+    mask: MatLike | None = None,
+    binary: bool = False,
+) -> bool:
+    """
+    numbaの照合を使う条件(numbaが使える・マスクなし・1チャンネルの8bit画像・小さなテンプレート・狭い探索範囲)を満たすかを返す。
+    """
+    if not flag_import_numba or mask is not None:
+        return False
+    if image.ndim != 2 or template.ndim != 2:
+        return False
+    if image.dtype != uint8 or template.dtype != uint8:
+        return False
+    height, width = template.shape
+    if height > KERNEL_MAX_TEMPLATE_SIZE or width > KERNEL_MAX_TEMPLATE_SIZE:
+        return False
+    positions_y = image.shape[0] - height + 1
+    positions_x = image.shape[1] - width + 1
+    if positions_y <= 0 or positions_x <= 0:
+        return False
+    if binary:
+        return positions_y * positions_x <= KERNEL_MAX_BINARY_POSITIONS
+    return positions_y * positions_x * height * width <= KERNEL_MAX_GRAY_WORK
+
+
+def match_small(
+    image: MatLike,
+    template: MatLike,
+    binary: bool = False,
+) -> tuple[float, Sequence[int]]:
+    """
+    numbaで照合し、matchTemplate(TM_CCOEFF_NORMED)+minMaxLocと同じ(類似度の最大値, 位置)を返す。
+    binaryがTrueの場合は2値画像としてビット演算で照合する(0以外の画素は1として扱う)。
+    kernel_applicableを満たす画像で呼び出すこと。
+    """
+    kernel = _binary_kernel if binary else _gray_kernel
+    max_val, x, y = kernel(image, template)
+    return max_val, (x, y)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from ImageProcessing import get_image_processing
+from TemplateStore import get_template_store
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from cv2.typing import MatLike
+    from ImageProcessing import FrameCache
+
+
+class ScreenState(NamedTuple):
+    """
+    画面の状態の定義。
+
+    templateはテンプレート画像のパスまたは画像、cropは探索範囲でcrop_imageと同じ[y軸始点, y軸終点, x軸始点, x軸終点]。
+    priorityが大きい状態から順に評価する。
+    """
+
+    name: str
+    template: str | MatLike
+    threshold: float = 0.7
+    crop: list[int] | None = None
+    mask: str | MatLike | None = None
+    use_gray: bool = True
+    priority: int = 0
+
+
+class ScreenResult(NamedTuple):
+    """
+    ScreenRecognizer.recognizeの結果。
+
+    nameは判定した状態の名前(どの状態にも一致しなければNone)、scoreとlocationはその類似度とフレーム全体での位置。
+    scoresには評価した状態ごとの類似度が入る(打ち切った場合、評価しなかった状態は含まない)。
+    """
+
+    name: str | None
+    score: float
+    location: tuple[int, int]
+    scores: dict[str, float]
+    seq: int
+
+
+class ScreenRecognizer:
+    """
+    登録した画面の状態を1フレームに対してまとめて評価し、現在の画面を判定する。
+
+    フレームの変換はFrameCache、テンプレート画像の読み込みと前処理はTemplateStoreで共有する。
+    """
+
+    def __init__(self) -> None:
+        self.__states: list[ScreenState] = []
+
+    @property
+    def states(self) -> list[ScreenState]:
+        """
+        評価する順(priorityの大きい順、同じ場合は登録順)の状態の一覧を返す。
+        """
+        return sorted(self.__states, key=lambda state: -state.priority)
+
+    def add(
+        self,
+        name: str,
+        template: str | MatLike,
+        threshold: float = 0.7,
+        crop: list[int] | None = None,
+        mask: str | MatLike | None = None,
+        use_gray: bool = True,
+        priority: int = 0,
+    ) -> ScreenRecognizer:
+        """
+        状態を登録する。同じ名前の状態がある場合は置き換える。
+        """
+        self.remove(name)
+        self.__states.append(
+            ScreenState(name, template, threshold, crop, mask, use_gray, priority),
+        )
+        return self
+
+    def remove(self, name: str) -> None:
+        self.__states = [state for state in self.__states if state.name != name]
+
+    def recognize(
+        self,
+        frame_cache: FrameCache,
+        short_circuit: bool = True,
+        resolve: Callable[[str], str] | None = None,
+    ) -> ScreenResult:
+        """
+        frame_cacheのフレームに対して状態を評価する。
+
+        short_circuitがTrueの場合は評価する順で最初に閾値を超えた状態で打ち切る。
+        Falseの場合はすべて評価し、閾値を超えた状態のうちpriority、類似度の順に大きいものを返す。
+        resolveにはテンプレート画像のパスを実際のファイルのパスに変換する関数を渡す。
+        """
+        store = get_template_store()
+        image_processing = get_image_processing()
+        best: tuple[int, float, str, tuple[int, int]] | None = None
+        scores: dict[str, float] = {}
+        for state in self.states:
+            # テンプレート画像を取得(ファイルの場合は前処理済みの画像ごとTemplateStoreから取得する)
+            preprocessed = None
+            if isinstance(state.template, str):
+                path = (
+                    resolve(state.template) if resolve is not None else state.template
+                )
+                template = store.read(path, mode="color")
+                preprocessed = store.preprocessed(
+                    path,
+                    use_gray=state.use_gray,
+                )
+            else:
+                template = state.template
+            if template is None:
+                msg = f"template_path:{state.template}から画像を取得できませんでした。"
+                raise ValueError(msg)
+            if isinstance(state.mask, str):
+                mask_path = resolve(state.mask) if resolve is not None else state.mask
+                mask = store.read(mask_path, mode="binary")
+                if mask is None:
+                    msg = f"mask_path:{mask_path}から画像を取得できませんでした。"
+                    raise ValueError(msg)
+            else:
+                mask = state.mask
+
+            res, max_loc, _, _, max_val = image_processing.isContainTemplate(
+                frame_cache.frame,
+                template,
+                mask_image=mask,
+                threshold=state.threshold,
+                use_gray=state.use_gray,
+                crop=state.crop,
+                frame_cache=frame_cache,
+                preprocessed_template=preprocessed,
+            )
+            scores[state.name] = max_val
+            if not res:
+                continue
+            # フレーム全体の座標に直す
+            location = (max_loc[0], max_loc[1])
+            if state.crop is not None and len(state.crop) >= 4:
+                location = (location[0] + state.crop[2], location[1] + state.crop[0])
+            if best is None or (state.priority, max_val) > best[:2]:
+                best = (state.priority, max_val, state.name, location)
+            if short_circuit:
+                break
+
+        if best is None:
+            return ScreenResult(None, 0.0, (0, 0), scores, frame_cache.seq)
+        _, score, name, location = best
+        return ScreenResult(name, score, location, scores, frame_cache.seq)
@@ -186,6 +186,13 @@ class GuiSettings:
             ]
         except Exception:
             self.pos_dialogue_buttons = "2"
+        # カメラIDごとのキャプチャフォーマット(Camera.CaptureProfile.to_setting()の値、計測に失敗した場合はCamera.CAPTURE_PROFILE_FAILED)
+        try:
+            self.capture_profiles: dict[str, str] = dict(
+                self.setting["Capture Profile"],
+            )
+        except Exception:
+            self.capture_profiles = {}
 
     def load(self):
         if os.path.isfile(self.setting_path):
@@ -293,6 +300,7 @@ class GuiSettings:
             "software_controller_position": "2",
             "dialogue_buttons_position": "2",
         }
+        self.setting["Capture Profile"] = {}
         with open(self.setting_path, "w", encoding="utf-8") as file:
             self.setting.write(file)
         os.chmod(path=self.setting_path, mode=0o660)
@@ -366,6 +374,8 @@ class GuiSettings:
             "dialogue_buttons_position": self.pos_dialogue_buttons,
         }
 
+        self.setting["Capture Profile"] = self.capture_profiles
+
         with open(self.setting_path, "w", encoding="utf-8") as file:
             self.setting.write(file)
         os.chmod(path=self.setting_path, mode=0o660)
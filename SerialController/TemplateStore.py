@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from logging import DEBUG, NullHandler, getLogger
+from typing import TYPE_CHECKING, cast
+
+from ImageProcessing import doPreprocessImage, getImage
+from numpy import ndarray
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Hashable
+    from logging import Logger
+    from typing import Literal
+
+    from cv2.typing import MatLike
+
+    type ImageMode = Literal["color", "binary", "gray"]
+    type BGRRange = dict[Literal["lower", "upper"], int | tuple[int, int, int]]
+    type Preprocessed = tuple[MatLike, int, int]
+
+
+def _nbytes(image: MatLike) -> int:
+    """
+    画像が自身で確保しているメモリ量を返す(他の画像のビューは0)
+    """
+    return image.nbytes if image.base is None else 0
+
+
+def _variant_key(
+    use_gray: bool,
+    crop: list[int] | None,
+    BGR_range: BGRRange | None,
+    threshold_binary: int | None,
+) -> tuple[object, ...]:
+    """
+    doPreprocessImageの引数を前処理済み画像のキーに変換する
+    """
+    range_key = (
+        None
+        if BGR_range is None
+        else tuple(
+            (k, tuple(v) if isinstance(v, (list, tuple)) else v)
+            for k, v in sorted(BGR_range.items())
+        )
+    )
+    crop_key = None if crop is None or len(crop) < 4 else tuple(crop[:4])
+    return (use_gray, crop_key, range_key, threshold_binary)
+
+
+class _TemplateEntry:
+    """
+    1つの画像ファイルについて、デコード済みの画像と前処理済みの画像を保持する。
+    """
+
+    def __init__(self, mtime_ns: int, size: int, image: MatLike) -> None:
+        self.mtime_ns: int = mtime_ns
+        self.size: int = size
+        self.image: MatLike = image
+        self.variants: dict[tuple[object, ...], Preprocessed] = {}
+        self.derived: dict[Hashable, object] = {}
+        self.nbytes: int = _nbytes(image)
+
+
+class TemplateStore:
+    """
+    テンプレート画像・マスク画像をデコード済みの状態でプロセス全体で保持する。
+
+    キーは解決済みのパスと読み込みモードで、ファイルの更新日時またはサイズが変わった場合は読み込み直す。
+    doPreprocessImageによる前処理(グレースケール化・トリミング・2値化)の結果も合わせて保持する。
+    合計サイズがmax_bytesを超える場合は最も長く使われていない画像から破棄する。
+    返す画像は読み取り専用。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self._logger: Logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__lock: threading.RLock = threading.RLock()
+        self.__entries: OrderedDict[tuple[str, ImageMode], _TemplateEntry] = (
+            OrderedDict()
+        )
+        self.__bytes: int = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.__bytes
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def read(self, path: str, mode: ImageMode = "color") -> MatLike | None:
+        """
+        画像を返す。保持していないか、ファイルが更新されている場合はファイルから読み込む。
+        """
+        entry = self.__entry(path, mode)
+        return None if entry is None else entry.image
+
+    def preprocessed(
+        self,
+        path: str,
+        use_gray: bool = True,
+        crop: list[int] | None = None,
+        BGR_range: BGRRange | None = None,
+        threshold_binary: int | None = None,
+    ) -> Preprocessed | None:
+        """
+        カラー画像にdoPreprocessImageを適用した結果(画像, 幅, 高さ)を返す。
+        """
+        key = _variant_key(use_gray, crop, BGR_range, threshold_binary)
+        with self.__lock:
+            entry = self.__entry(path, "color")
+            if entry is None:
+                return None
+            variant = entry.variants.get(key)
+            if variant is None:
+                src, width, height = doPreprocessImage(
+                    entry.image,
+                    use_gray=use_gray,
+                    crop=crop,
+                    BGR_range=BGR_range,
+                    threshold_binary=threshold_binary,
+                )
+                if src.base is None:
+                    src.flags.writeable = False
+                variant = (src, width, height)
+                entry.variants[key] = variant
+                entry.nbytes += _nbytes(src)
+                self.__bytes += _nbytes(src)
+                self.__evict()
+            return variant
+
+    def derived[T](
+        self,
+        path: str,
+        key: Hashable,
+        build: Callable[[MatLike], T],
+        mode: ImageMode = "color",
+    ) -> T | None:
+        """
+        画像から計算した値(ヒストグラムなど)をbuild(画像)で作成して画像ごとに保持し、返す。
+        keyは作成方法を区別するキーで、画像を読み込み直した場合は作成し直す。
+        """
+        with self.__lock:
+            entry = self.__entry(path, mode)
+            if entry is None:
+                return None
+            if key not in entry.derived:
+                value = build(entry.image)
+                entry.derived[key] = value
+                if isinstance(value, ndarray):
+                    entry.nbytes += _nbytes(value)
+                    self.__bytes += _nbytes(value)
+                    self.__evict()
+            return cast("T", entry.derived[key])
+
+    def invalidate(self, path: str | None = None) -> None:
+        """
+        保持している画像を破棄する。pathを省略した場合はすべて破棄する。
+        """
+        with self.__lock:
+            if path is None:
+                self.__entries.clear()
+                self.__bytes = 0
+                return
+            resolved = os.path.realpath(path)
+            for key in [k for k in self.__entries if k[0] == resolved]:
+                self.__bytes -= self.__entries.pop(key).nbytes
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def __entry(self, path: str, mode: ImageMode) -> _TemplateEntry | None:
+        if not path:
+            return None
+        resolved = os.path.realpath(path)
+        key = (resolved, mode)
+        try:
+            stat = os.stat(resolved)
+        except OSError:
+            stat = None
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if (
+                entry is not None
+                and stat is not None
+                and entry.mtime_ns == stat.st_mtime_ns
+                and entry.size == stat.st_size
+            ):
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return entry
+
+            self.misses += 1
+            if entry is not None:
+                # ファイルが更新または削除された
+                self.__bytes -= self.__entries.pop(key).nbytes
+            if stat is None:
+                return None
+            image = getImage(resolved, mode=mode)
+            if image is None:
+                return None
+            image.flags.writeable = False
+            entry = _TemplateEntry(stat.st_mtime_ns, stat.st_size, image)
+            self.__entries[key] = entry
+            self.__bytes += entry.nbytes
+            self._logger.debug(f"Template loaded: {resolved} ({mode})")
+            self.__evict()
+            return entry
+
+    def __evict(self) -> None:
+        # 直前に使った1件は残す
+        while self.__bytes > self.max_bytes and len(self.__entries) > 1:
+            key, entry = self.__entries.popitem(last=False)
+            self.__bytes -= entry.nbytes
+            self._logger.debug(f"Template evicted: {key[0]} ({key[1]})")
+
+
+_template_store: TemplateStore | None = None
+_template_store_lock = threading.Lock()
+
+
+def get_template_store() -> TemplateStore:
+    """
+    プロセス全体で共有するTemplateStoreを返す。
+    """
+    global _template_store  # noqa: PLW0603
+    if _template_store is None:
+        with _template_store_lock:
+            if _template_store is None:
+                _template_store = TemplateStore()
+    return _template_store
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import DEBUG, NullHandler, getLogger
+from typing import TYPE_CHECKING, NamedTuple, Protocol, cast
+
+import cv2
+from ImageProcessing import HitStats
+from PIL import Image
+
+try:
+    import pyocr  # noqa: F401
+
+    flag_import_pyocr = True
+except Exception:
+    flag_import_pyocr = False
+
+if TYPE_CHECKING:
+    from logging import Logger
+    from typing import Any
+
+    from cv2.typing import MatLike
+
+
+class OcrPreset(NamedTuple):
+    """
+    OCRの前にROIへ行う前処理。
+
+    scale: 拡大率(小さな文字は拡大した方が認識しやすい)
+    threshold: 2値化の閾値(Noneは大津の2値化、-1は2値化しない)
+    invert: 白黒を反転する(暗い背景に明るい文字の場合にTrue。OCRエンジンは白背景に黒文字を想定している)
+    blur: 拡大後にかけるメディアンフィルタのサイズ(0はかけない)
+    """
+
+    scale: float = 2.0
+    threshold: int | None = None
+    invert: bool = False
+    blur: int = 0
+
+
+# read_textのpreprocessに名前で指定できる前処理
+OCR_PRESETS: dict[str, OcrPreset] = {
+    "none": OcrPreset(scale=1.0, threshold=-1),
+    "default": OcrPreset(),
+    "dark_text": OcrPreset(scale=3.0),
+    "light_text": OcrPreset(scale=3.0, invert=True),
+    "digits": OcrPreset(scale=3.0, blur=3),
+    "light_digits": OcrPreset(scale=3.0, invert=True, blur=3),
+}
+
+
+class OcrEngine(Protocol):
+    """
+    TextReaderが使うOCRエンジン。前処理済みの画像とcharset(認識する文字の候補、Noneは制限なし)から文字列を返す。
+    """
+
+    def recognize(self, image: MatLike, charset: str | None) -> str: ...
+
+
+class PyocrEngine:
+    """
+    pyocr(Tesseract)を使うOCRエンジン。
+    layoutはTesseractのページ分割モード(7は1行のテキスト)。
+    """
+
+    def __init__(self, lang: str = "eng", layout: int = 7) -> None:
+        if not flag_import_pyocr:
+            msg = "pyocrをインポートできませんでした。pyocrをインストールしてください。"
+            raise RuntimeError(msg)
+        # pyocrがない場合にも名前が未定義にならないよう、インポートできたことを確認してから読み込む
+        import pyocr  # noqa: PLC0415
+
+        # pyocrには型情報がないため、ツールはAnyとして扱う
+        tools = cast("list[Any]", pyocr.get_available_tools())
+        if not tools:
+            msg = "OCRツールが見つかりません。Tesseractをインストールしてください。"
+            raise RuntimeError(msg)
+        self.tool: Any = tools[0]
+        self.lang: str = lang
+        self.layout: int = layout
+
+    def recognize(self, image: MatLike, charset: str | None) -> str:
+        import pyocr.builders  # noqa: PLC0415
+
+        builder: Any = pyocr.builders.TextBuilder(tesseract_layout=self.layout)
+        if charset:
+            builder.tesseract_configs += ["-c", f"tessedit_char_whitelist={charset}"]
+        text: str = self.tool.image_to_string(
+            Image.fromarray(image),
+            lang=self.lang,
+            builder=builder,
+        )
+        return text.strip()
+
+
+def preprocess_for_ocr(image: MatLike, preset: OcrPreset) -> MatLike:
+    """
+    OCRの前処理(グレースケール化・拡大・2値化・反転)を行う。
+    """
+    src = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if preset.scale != 1.0:
+        src = cv2.resize(
+            src,
+            None,
+            fx=preset.scale,
+            fy=preset.scale,
+            interpolation=cv2.INTER_CUBIC,
+        )
+    if preset.blur > 0:
+        src = cv2.medianBlur(src, preset.blur)
+    if preset.threshold is None:
+        _, src = cv2.threshold(src, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    elif preset.threshold >= 0:
+        _, src = cv2.threshold(src, preset.threshold, 255, cv2.THRESH_BINARY)
+    if preset.invert:
+        src = cv2.bitwise_not(src)
+    return src
+
+
+class TextReader:
+    """
+    OCRをワーカースレッドで行い、結果を前処理済みの画像ごとに保持する。
+
+    前処理済みの画像の内容(ハッシュ)とcharsetが同じであれば、OCRエンジンを呼ばずに前回の結果を返す。
+    OCR中の同じ画像の要求は実行中の結果を共有する。
+    engineを省略した場合は、最初にOCRが必要になった時点でPyocrEngineを作成する。
+    """
+
+    def __init__(
+        self,
+        engine: OcrEngine | None = None,
+        workers: int = 1,
+        max_entries: int = 1024,
+    ) -> None:
+        self._logger: Logger = getLogger(__name__)
+        self._logger.addHandler(NullHandler())
+        self._logger.setLevel(DEBUG)
+        self._logger.propagate = True
+        self.max_entries: int = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__engine: OcrEngine | None = engine
+        self.__lock: threading.Lock = threading.Lock()
+        self.__results: OrderedDict[tuple[str, str | None], Future[str]] = OrderedDict()
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="OcrThread",
+        )
+
+    def set_engine(self, engine: OcrEngine | None) -> None:
+        """
+        OCRエンジンを変更する。保持している結果は破棄する。
+        """
+        with self.__lock:
+            self.__engine = engine
+            self.__results.clear()
+
+    def submit(
+        self,
+        image: MatLike,
+        charset: str | None = None,
+        preset: str | OcrPreset = "default",
+    ) -> Future[str]:
+        """
+        imageを前処理してOCRを予約し、結果のFutureを返す。前処理は呼び出したスレッドで行う。
+        """
+        if isinstance(preset, str):
+            if preset not in OCR_PRESETS:
+                msg = f"preprocess:{preset}は{list(OCR_PRESETS)}のいずれかを指定してください。"
+                raise ValueError(msg)
+            preset = OCR_PRESETS[preset]
+        src = preprocess_for_ocr(image, preset)
+        digest = hashlib.blake2b(src.tobytes(), digest_size=16)
+        digest.update(repr(src.shape).encode())
+        key = (digest.hexdigest(), charset)
+        with self.__lock:
+            future = self.__results.get(key)
+            if future is not None and not (future.done() and future.exception()):
+                self.hits += 1
+                self.__results.move_to_end(key)
+                return future
+            self.misses += 1
+            future = self.__executor.submit(self.__recognize, src, charset)
+            self.__results[key] = future
+            while len(self.__results) > self.max_entries:
+                self.__results.popitem(last=False)
+        return future
+
+    def read(
+        self,
+        image: MatLike,
+        charset: str | None = None,
+        preset: str | OcrPreset = "default",
+        timeout: float | None = None,
+    ) -> str:
+        """
+        imageのOCRの結果を返す(submitの結果を待つ)。
+        """
+        return self.submit(image, charset, preset).result(timeout)
+
+    def stats(self) -> HitStats:
+        return HitStats(self.hits, self.misses)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __recognize(self, image: MatLike, charset: str | None) -> str:
+        engine = self.__engine
+        if engine is None:
+            with self.__lock:
+                if self.__engine is None:
+                    self.__engine = PyocrEngine()
+                engine = self.__engine
+        text = engine.recognize(image, charset)
+        self._logger.debug(f"OCR result: {text!r}")
+        return text
+
+
+_text_reader: TextReader | None = None
+_text_reader_lock = threading.Lock()
+
+
+def get_text_reader() -> TextReader:
+    """
+    プロセス全体で共有するTextReaderを返す。
+    """
+    global _text_reader  # noqa: PLW0603
+    if _text_reader is None:
+        with _text_reader_lock:
+            if _text_reader is None:
+                _text_reader = TextReader()
+    return _text_reader
@@ -11,6 +11,7 @@ import subprocess
 import sys
 import threading
 import tkinter.messagebox as tkmsg
+from concurrent.futures import Future
 from logging import DEBUG, NullHandler, getLogger
 from operator import itemgetter
 from os.path import abspath, dirname
@@ -33,7 +34,7 @@ import contextlib
 import PokeConLogger
 import Settings
 import Utility as util
-from Camera import Camera
+from Camera import CAPTURE_PROFILE_FAILED, Camera, CaptureProfile
 from CommandLoader import CommandLoader
 from Commands import McuCommandBase, PythonCommandBase, Sender
 from Commands.CommandBase import Command
@@ -45,6 +46,7 @@ from ExternalTools import MQTTCommunications, SocketCommunications
 from file_handler import FileHandler
 from gui.assets import CaptureArea
 from gui.controller import ControllerGUI
+from ImageWriter import get_image_writer
 from Keyboard import SwitchKeyboardController
 from KeyConfig import PokeKeycon
 from Menubar import PokeController_Menubar
@@ -1881,6 +1883,10 @@ class PokeControllerApp:
             self.camera_id_entry.config(state="normal")
         # open up a camera
         self.camera: Camera = Camera(int(self.fps.get()))
+        # 実行中のキャプチャフォーマットの計測(デバイスを開けたか, 選択したフォーマット)
+        self.camera_negotiation: Future[tuple[bool, CaptureProfile | None]] | None = (
+            None
+        )
         self.openCamera()
         # CameraのFlipを反映する
         self.applyFlip()
@@ -2179,7 +2185,55 @@ class PokeControllerApp:
         # logging.debug(f'python version: {sys.version}')
 
     def openCamera(self) -> None:
-        self.camera.openCamera(self.camera_id.get())
+        # 保存済みのキャプチャフォーマットがなければ計測して選択し、次回以降のために保存する
+        if self.camera_negotiation is not None:
+            self._logger.info("Capture profile negotiation is in progress.")
+            return
+        camera_index = self.camera_id.get()
+        camera_id = str(camera_index)
+        saved = self.settings.capture_profiles.get(camera_id)
+        profile = CaptureProfile.from_setting(saved)
+        if profile is not None or saved == CAPTURE_PROFILE_FAILED:
+            # 計測に失敗したことのあるカメラは計測せずに解像度のみ設定する
+            self.camera.openCamera(camera_index, profile=profile)
+            return
+
+        # 計測には数秒かかるため、UIを止めないよう別スレッドで行い、結果はTkのスレッドで保存する
+        future: Future[tuple[bool, CaptureProfile | None]] = Future()
+
+        def negotiate() -> None:
+            try:
+                applied = self.camera.openCamera(camera_index, negotiate=True)
+                future.set_result((self.camera.isOpened(), applied))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.camera_negotiation = future
+        threading.Thread(
+            target=negotiate,
+            name="CaptureNegotiation",
+            daemon=True,
+        ).start()
+        self.root.after(100, self.pollCameraNegotiation, camera_id)
+
+    def pollCameraNegotiation(self, camera_id: str) -> None:
+        future = self.camera_negotiation
+        if future is None:
+            return
+        if not future.done():
+            self.root.after(100, self.pollCameraNegotiation, camera_id)
+            return
+        self.camera_negotiation = None
+        try:
+            opened, applied = future.result()
+        except Exception:
+            self._logger.exception("Capture profile negotiation failed.")
+            return
+        if applied is not None:
+            self.settings.capture_profiles[camera_id] = applied.to_setting()
+        elif opened:
+            # デバイスは開けたがどのフォーマットも取得できなかった(次回以降は計測しない)
+            self.settings.capture_profiles[camera_id] = CAPTURE_PROFILE_FAILED
 
     def assignCamera(self, event: tk.Event) -> None:  # noqa: ARG002
         self.camera_name_fromDLL.set(self.camera_dic[self.camera_id.get()])
@@ -2289,7 +2343,8 @@ class PokeControllerApp:
         self.serial_device_name_cb["values"] = self.serial_devices
 
     def saveCapture(self) -> None:
-        self.camera.saveCapture()
+        # UIを止めないようバックグラウンドで保存する
+        self.camera.saveCapture(async_save=True)
 
     def OpenCaptureDir(self) -> None:
         directory = "Captures"
@@ -3027,6 +3082,8 @@ class PokeControllerApp:
             self.settings.save()
 
             self.camera.destroy()
+            # 保存待ちの画像を書き終えてから終了する
+            get_image_writer().flush(timeout=5.0)
             try:
                 cv2.destroyAllWindows()
             except cv2.error:
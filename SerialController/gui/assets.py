@@ -249,6 +249,7 @@ class CaptureArea(tk.Canvas):
                 int(self.max_x * ratio_x),
                 int(self.max_y * ratio_x),
             ],
+            async_save=True,
         )
 
         # t = 0
@@ -290,6 +291,7 @@ class CaptureArea(tk.Canvas):
                     int(self.max_x * ratio_x),
                     int(self.max_y * ratio_x),
                 ],
+                async_save=True,
             )
 
         # t = 0
@@ -700,7 +702,7 @@ class CaptureArea(tk.Canvas):
 
     def update(self) -> None:
         if self.is_show_var.get():
-            image_bgr = self.camera.readFrame()
+            image_bgr, _ = self.camera.read_frame_view()
         else:
             # self.after(self.next_frames, self.update)
             return
@@ -721,7 +723,8 @@ class CaptureArea(tk.Canvas):
         # self.after(self.next_frames, self.update)
 
     def saveCapture(self) -> None:
-        self.camera.saveCapture()
+        # UIを止めないようバックグラウンドで保存する
+        self.camera.saveCapture(async_save=True)
 
     def ImgRect(
         self,
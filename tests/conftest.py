@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+# SerialController内のモジュールはSerialControllerを作業ディレクトリとして実行する前提のため、パスに追加する
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "SerialController"))
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import cv2
+import numpy as np
+from ImageProcessing import ChangeGate
+
+
+def _screen(height: int, width: int) -> np.ndarray:
+    """
+    ぼかした乱数の画像(ゲーム画面の代わり)を作る。
+    """
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(image, (9, 9), 0)
+
+
+def _is_unchanged(before: np.ndarray, after: np.ndarray) -> bool:
+    gate: ChangeGate[str] = ChangeGate()
+    gate.put("key", gate.fingerprint(before), (), "result")
+    return gate.get("key", gate.fingerprint(after)) is not None
+
+
+def test_same_frame_is_unchanged() -> None:
+    frame = _screen(720, 1280)
+    assert _is_unchanged(frame, frame.copy())
+
+
+def test_noise_is_unchanged() -> None:
+    frame = _screen(200, 300)
+    rng = np.random.default_rng(1)
+    noisy = np.clip(frame + rng.normal(0, 2, frame.shape), 0, 255).astype(np.uint8)
+    assert _is_unchanged(frame, noisy)
+
+
+def test_small_icon_in_full_frame_is_changed() -> None:
+    frame = _screen(720, 1280)
+    changed = frame.copy()
+    changed[600:660, 1100:1160] = 255
+    assert not _is_unchanged(frame, changed)
+
+
+def test_small_change_in_crop_is_changed() -> None:
+    frame = _screen(200, 300)
+    changed = frame.copy()
+    changed[90:110, 140:160] = 0
+    assert not _is_unchanged(frame, changed)
+
+
+def test_deps_must_be_same_object() -> None:
+    frame = _screen(64, 64)
+    gate: ChangeGate[str] = ChangeGate()
+    template = np.zeros((8, 8), dtype=np.uint8)
+    gate.put("key", gate.fingerprint(frame), (template,), "result")
+    assert gate.get("key", gate.fingerprint(frame), (template,)) == "result"
+    assert gate.get("key", gate.fingerprint(frame), (template.copy(),)) is None
+    assert gate.stats() == (1, 1)
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import cv2
+import numpy as np
+from HashPrefilter import HashPrefilter
+from ImageProcessing import ImageProcessing
+
+
+def _pattern(height: int, width: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(image, (5, 5), 0)
+
+
+def test_unmasked_mismatch_is_rejected() -> None:
+    prefilter = HashPrefilter(audit_interval=1000)
+    matched, _, _, _, max_val = ImageProcessing().isContainTemplate(
+        _pattern(64, 64, 1),
+        _pattern(64, 64, 2),
+        threshold=0.8,
+        prefilter=prefilter,
+    )
+    assert not matched
+    assert max_val == -np.inf
+    assert prefilter.stats().rejected == 1
+
+
+def test_masked_template_is_not_rejected() -> None:
+    # マスクで除いた右側だけが反転している(ハッシュは大きく異なるが、マスク付きの照合では一致する)
+    template = _pattern(64, 64, 1)
+    image = template.copy()
+    image[:, 24:] = 255 - template[:, 24:]
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    mask[:, :24] = 255
+    prefilter = HashPrefilter(audit_interval=1000)
+    assert prefilter.rejects(
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),
+        cv2.cvtColor(template, cv2.COLOR_BGR2GRAY),
+    )
+    prefilter.reset()
+
+    matched, _, _, _, max_val = ImageProcessing().isContainTemplate(
+        image,
+        template,
+        mask_image=mask,
+        threshold=0.8,
+        prefilter=prefilter,
+    )
+    assert matched
+    assert max_val > 0.99
+    assert prefilter.stats().checked == 0
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+import pytest
+from ImageProcessing import FrameCache
+from ScreenRecognizer import ScreenRecognizer
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _frame() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(image, (5, 5), 0)
+
+
+def test_recognize_finds_template() -> None:
+    frame = _frame()
+    recognizer = ScreenRecognizer().add("icon", frame[40:72, 60:92].copy())
+    result = recognizer.recognize(FrameCache(frame))
+    assert result.name == "icon"
+    assert result.location == (60, 40)
+
+
+def test_missing_mask_path_raises(tmp_path: Path) -> None:
+    frame = _frame()
+    recognizer = ScreenRecognizer().add(
+        "icon",
+        frame[40:72, 60:92].copy(),
+        mask=str(tmp_path / "missing_mask.png"),
+    )
+    with pytest.raises(ValueError, match="mask_path"):
+        recognizer.recognize(FrameCache(frame))